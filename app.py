@@ -1,421 +1,212 @@
+import startup  # first, so the fallback start time is taken before heavy imports
 import streamlit as st
 import pandas as pd
-import numpy as np
+import hashlib
 import io
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import uuid
 from datetime import datetime, timedelta
 
-@st.cache_data
-def calculate_report_hours_from_data(start_dates, end_dates, start_times, end_times, time_shifts):
-    """Calculate Report Hours from Start Date/Time, End Date/Time and Time Shift"""
-    report_hours = []
-    
-    for idx in range(len(start_dates)):
-        try:
-            # Get date and time components
-            start_date = pd.to_datetime(start_dates[idx], errors='coerce')
-            end_date = pd.to_datetime(end_dates[idx], errors='coerce')
-            
-            # Get time components (handle various formats)
-            start_time = str(start_times[idx] if idx < len(start_times) else "00:00:00").strip()
-            end_time = str(end_times[idx] if idx < len(end_times) else "00:00:00").strip()
-            
-            # Handle time shift (convert to hours)
-            time_shift = time_shifts[idx] if idx < len(time_shifts) else 0
-            if pd.isna(time_shift):
-                time_shift = 0
-            else:
-                time_shift = float(time_shift)
-            
-            # Create datetime objects
-            if pd.notna(start_date) and pd.notna(end_date):
-                # Parse time strings
-                try:
-                    start_time_obj = pd.to_datetime(start_time, format='%H:%M:%S').time()
-                except:
-                    try:
-                        start_time_obj = pd.to_datetime(start_time, format='%H:%M').time()
-                    except:
-                        start_time_obj = datetime.strptime("00:00:00", '%H:%M:%S').time()
-                
-                try:
-                    end_time_obj = pd.to_datetime(end_time, format='%H:%M:%S').time()
-                except:
-                    try:
-                        end_time_obj = pd.to_datetime(end_time, format='%H:%M').time()
-                    except:
-                        end_time_obj = datetime.strptime("00:00:00", '%H:%M:%S').time()
-                
-                # Combine date and time
-                start_datetime = datetime.combine(start_date.date(), start_time_obj)
-                end_datetime = datetime.combine(end_date.date(), end_time_obj)
-                
-                # Calculate time difference
-                time_diff = end_datetime - start_datetime
-                hours_diff = time_diff.total_seconds() / 3600
-                
-                # Add time shift
-                total_hours = hours_diff + time_shift
-                
-                report_hours.append(round(total_hours, 2))
-            else:
-                report_hours.append(0)
-                
-        except Exception as e:
-            report_hours.append(0)
-    
-    return report_hours
-
-def calculate_report_hours(df):
-    """Calculate Report Hours from Start Date/Time, End Date/Time and Time Shift"""
-    df = df.copy()
-    start_dates = df.get("Start Date", pd.Series([None]*len(df))).tolist()
-    end_dates = df.get("End Date", pd.Series([None]*len(df))).tolist()
-    start_times = df.get("Start Time", pd.Series(["00:00:00"]*len(df))).tolist()
-    end_times = df.get("End Time", pd.Series(["00:00:00"]*len(df))).tolist()
-    time_shifts = df.get("Time Shift", pd.Series([0]*len(df))).tolist()
-    
-    return calculate_report_hours_from_data(
-        tuple(start_dates), 
-        tuple(end_dates), 
-        tuple(start_times), 
-        tuple(end_times), 
-        tuple(time_shifts)
-    )
+import config
+import dedup
+import exhaust
+import grid
+import history
+import kpi
+import notifications
+import outbox
+import run_diff
+import validation
 
 @st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: lambda x: x.to_json()})
 def validate_reports(df):
     """Validate ship reports and return failed rows with reasons"""
-    df = df.copy()
-    
-    # --- Clean numeric columns ---
-    numeric_cols = [
-        "Average Load [kW]",
-        "ME Rhrs (From Last Report)",
-        "Avg. Speed",
-        "Fuel Cons. [MT] (ME Cons 1)",
-        "Fuel Cons. [MT] (ME Cons 2)",
-        "Fuel Cons. [MT] (ME Cons 3)",
-        "Time Shift",
-        "Average Load [%]",
-        "A.E. 1 Last Report [Rhrs] (Aux Engine Unit 1)",
-        "A.E. 2 Last Report [Rhrs] (Aux Engine Unit 2)",
-        "A.E. 3 Last Report [Rhrs] (Aux Engine Unit 3)",
-        "A.E. 4 Total [Rhrs] (Aux Engine Unit 4)",
-        "A.E. 5 Last Report [Rhrs] (Aux Engine Unit 5)",
-        "A.E. 6 Last Report [Rhrs] (Aux Engine Unit 6)",
-        "Tank Cleaning [MT]",
-        "Cargo Transfer [MT]",
-        "Maintaining Cargo Temp. [MT]",
-        "Shaft Gen. Propulsion [MT]",
-        "Raising Cargo Temp. [MT]",
-        "Burning Sludge [MT]",
-        "Ballast Transfer [MT]",
-        "Fresh Water Prod. [MT]",
-        "Others [MT]",
-        "EGCS Consumption [MT]",
-        "Cyl. Oil Cons. [Ltrs]"  # Added for SCOC calculation
-    ]
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(",", "")
-                .str.strip()
-                .replace(["", "nan", "None"], np.nan)
-            )
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    return validation.validate_reports(df)
 
-    # --- Calculate Report Hours ---
-    df["Report Hours"] = calculate_report_hours(df)
 
-    # --- Calculate SFOC in g/kWh ---
-    df["SFOC"] = (
-        (
-            df["Fuel Cons. [MT] (ME Cons 1)"]
-            + df["Fuel Cons. [MT] (ME Cons 2)"]
-            + df["Fuel Cons. [MT] (ME Cons 3)"]
-        )
-        * 1_000_000
-        / (df["Average Load [kW]"].replace(0, np.nan)
-           * df["ME Rhrs (From Last Report)"].replace(0, np.nan))
+@st.cache_data(show_spinner=False, max_entries=8)
+def exhaust_diagnostics(_df, data_key):
+    """Per-vessel deviation heatmap, per-unit trend and per-report summary"""
+    return (
+        exhaust.deviation_heatmap(_df, by="Ship Name"),
+        exhaust.unit_trend(_df, by="Ship Name"),
+        exhaust.exhaust_summary(_df),
     )
-    df["SFOC"] = df["SFOC"].fillna(0)
 
-    # --- Calculate SCOC in g/kWh ---
-    df["SCOC"] = (
-        df["Cyl. Oil Cons. [Ltrs]"] * 1000
-        / (df["Average Load [kW]"].replace(0, np.nan)
-           * df["ME Rhrs (From Last Report)"].replace(0, np.nan))
-    )
-    df["SCOC"] = df["SCOC"].fillna(0)
-
-    reasons = []
-    fail_columns = set()
-
-    for idx, row in df.iterrows():
-        reason = []
-        report_type = str(row.get("Report Type", "")).strip()
-        ME_Rhrs = row.get("ME Rhrs (From Last Report)", 0)
-        report_hours = row.get("Report Hours", 0)
-        sfoc = row.get("SFOC", 0)
-        scoc = row.get("SCOC", 0)
-        avg_speed = row.get("Avg. Speed", 0)
-
-        # --- Rule 1: SFOC (only for At Sea) ---
-        if report_type == "At Sea" and ME_Rhrs > 12:
-            if not (150 <= sfoc <= 200):
-                reason.append("SFOC out of 150-200 at sea with ME Rhrs > 12")
-                fail_columns.add("SFOC")
-
-        # --- Rule 2: Avg Speed (only for At Sea) ---
-        if report_type == "At Sea" and ME_Rhrs > 12:
-            if not (0 <= avg_speed <= 20):
-                reason.append("Avg. Speed out of 0-20 at sea with ME Rhrs > 12")
-                fail_columns.add("Avg. Speed")
-
-        # --- Rule 3: Exhaust Temp deviation (Units 1-16, only At Sea) ---
-        if report_type == "At Sea" and ME_Rhrs > 12:
-            exhaust_cols = [
-                f"Exh. Temp [°C] (Main Engine Unit {j})"
-                for j in range(1, 17)
-                if f"Exh. Temp [°C] (Main Engine Unit {j})" in df.columns
-            ]
-            temps = [row[c] for c in exhaust_cols if pd.notna(row[c]) and row[c] != 0]
-            if temps:
-                avg_temp = np.mean(temps)
-                for j, c in enumerate(exhaust_cols, start=1):
-                    val = row[c]
-                    if pd.notna(val) and val != 0 and abs(val - avg_temp) > 50:
-                        reason.append(f"Exhaust temp deviation > ±50 from avg at Unit {j}")
-                        fail_columns.add(c)
-
-        # --- Rule 4: ME Rhrs should not exceed Report Hours (with ±1 hour margin) ---
-        if report_hours > 0:
-            hours_diff = ME_Rhrs - report_hours
-            if hours_diff > 1.0:
-                reason.append(f"ME Rhrs ({ME_Rhrs:.2f}) exceeds Report Hours ({report_hours:.2f}) by {hours_diff:.2f}h (margin: ±1h)")
-                fail_columns.add("ME Rhrs (From Last Report)")
-                fail_columns.add("Report Hours")
-
-        # --- Rule 5: Multiple Aux Engines operating at sea without sub-consumers ---
-        if report_type == "At Sea" and row.get("Average Load [%]", 0) > 40:
-            # Sum all auxiliary engine running hours
-            ae_rhrs_sum = (
-                row.get("A.E. 1 Last Report [Rhrs] (Aux Engine Unit 1)", 0) +
-                row.get("A.E. 2 Last Report [Rhrs] (Aux Engine Unit 2)", 0) +
-                row.get("A.E. 3 Last Report [Rhrs] (Aux Engine Unit 3)", 0) +
-                row.get("A.E. 4 Total [Rhrs] (Aux Engine Unit 4)", 0) +
-                row.get("A.E. 5 Last Report [Rhrs] (Aux Engine Unit 5)", 0) +
-                row.get("A.E. 6 Last Report [Rhrs] (Aux Engine Unit 6)", 0)
-            )
-            
-            # Calculate AE running hours ratio
-            if report_hours > 0:
-                ae_ratio = ae_rhrs_sum / report_hours
-            else:
-                ae_ratio = 0
-            
-            # Sum all sub-consumers
-            sub_consumers_sum = (
-                row.get("Tank Cleaning [MT]", 0) +
-                row.get("Cargo Transfer [MT]", 0) +
-                row.get("Maintaining Cargo Temp. [MT]", 0) +
-                row.get("Shaft Gen. Propulsion [MT]", 0) +
-                row.get("Raising Cargo Temp. [MT]", 0) +
-                row.get("Burning Sludge [MT]", 0) +
-                row.get("Ballast Transfer [MT]", 0) +
-                row.get("Fresh Water Prod. [MT]", 0) +
-                row.get("Others [MT]", 0) +
-                row.get("EGCS Consumption [MT]", 0)
-            )
-            
-            # Check if 2+ Aux Engines operating (ratio > 1.25) with ME Load > 40% and no sub-consumers
-            if ae_ratio > 1.25 and sub_consumers_sum == 0:
-                reason.append(f"Multiple Aux Engines operating at sea (AE Rhrs/Report Hours = {ae_ratio:.2f}) with ME Load > 40% but no sub-consumers reported. Please confirm operations and update sub-consumption fields if applicable")
-                fail_columns.add("Average Load [%]")
-                fail_columns.add("A.E. 1 Last Report [Rhrs] (Aux Engine Unit 1)")
-                fail_columns.add("A.E. 2 Last Report [Rhrs] (Aux Engine Unit 2)")
-                fail_columns.add("A.E. 3 Last Report [Rhrs] (Aux Engine Unit 3)")
-                fail_columns.add("Tank Cleaning [MT]")
-                fail_columns.add("Cargo Transfer [MT]")
-
-        # --- Rule 6: SCOC (Specific Cylinder Oil Consumption) - only for At Sea ---
-        if report_type == "At Sea" and ME_Rhrs > 12:
-            if scoc > 0:  # Only validate if SCOC was calculated (i.e., not zero/missing data)
-                if scoc < 0.8:
-                    reason.append(f"SCOC ({scoc:.2f} g/kWh) is lower than normal range (0.8-1.5 g/kWh)")
-                    fail_columns.add("SCOC")
-                    fail_columns.add("Cyl. Oil Cons. [Ltrs]")
-                elif scoc > 1.5:
-                    reason.append(f"SCOC ({scoc:.2f} g/kWh) is higher than normal range (0.8-1.5 g/kWh)")
-                    fail_columns.add("SCOC")
-                    fail_columns.add("Cyl. Oil Cons. [Ltrs]")
-
-        reasons.append("; ".join(reason))
-
-    df["Reason"] = reasons
-    failed = df[df["Reason"] != ""].copy()
-
-    # --- Always include Ship Name and Exhaust Temp columns ---
-    exhaust_cols = [
-        f"Exh. Temp [°C] (Main Engine Unit {j})"
-        for j in range(1, 17)
-        if f"Exh. Temp [°C] (Main Engine Unit {j})" in df.columns
-    ]
-
-    context_cols = [
-        "Ship Name",
-        "IMO_No",
-        "Report Type",
-        "Start Date",
-        "Start Time",
-        "End Date",
-        "End Time",
-        "Voyage Number",
-        "Time Zone",
-        "Distance - Ground [NM]",
-        "Time Shift",
-        "Distance - Sea [NM]",
-        "Average Load [kW]",
-        "Average RPM",
-        "Average Load [%]",
-        "ME Rhrs (From Last Report)",
-        "Report Hours",
-        "Cyl. Oil Cons. [Ltrs]",  # Added for SCOC context
-        "SCOC",  # Added calculated SCOC column
-    ]
-
-    # Combine all columns and remove duplicates while preserving order
-    cols_to_keep = context_cols + exhaust_cols + list(fail_columns) + ["Reason"]
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    cols_to_keep_unique = []
-    for col in cols_to_keep:
-        if col not in seen and col in failed.columns:
-            seen.add(col)
-            cols_to_keep_unique.append(col)
+
+@st.cache_resource
+def get_history_store():
+    """Shared history store for all sessions"""
+    return history.HistoryStore()
+
+
+@st.cache_data(show_spinner=False, ttl=60)
+def history_stats():
+    """Stored report counts; the folder watcher may write too, hence the ttl"""
+    return get_history_store().stats()
+
+
+@st.cache_data(show_spinner=False, ttl=60)
+def history_vessel_names():
+    """Vessel names in the history store, refreshed like history_stats"""
+    return get_history_store().vessels()["ship_name"].dropna().unique().tolist()
+
+
+@st.cache_resource(show_spinner="Warming up validator...")
+def prewarm_once():
+    """Pre-warm the parse/validate path once per process, in the first session"""
+    return startup.prewarm()
+
+
+@st.cache_resource
+def get_outbox():
+    """Shared on-disk email outbox"""
+    return outbox.Outbox()
+
+
+@st.cache_resource
+def get_delivery_worker(smtp_server, smtp_port, sender_email, sender_password):
+    """Background delivery worker, one per SMTP account and process"""
+    worker = outbox.DeliveryWorker(get_outbox(), smtp_server, smtp_port,
+                                   sender_email, sender_password)
+    worker.start()
+    return worker
+
+
+@st.fragment(run_every="2s")
+def show_outbox_status(batch_id):
+    """Live delivery status of a bulk send, refreshed without a full rerun"""
+    store = get_outbox()
+    counts = store.status_counts(batch_id)
+    st.subheader(f"Delivery Status (batch {batch_id})")
+    qcol1, qcol2, qcol3, qcol4 = st.columns(4)
+    qcol1.metric("Queued", counts["queued"])
+    qcol2.metric("Sending", counts["sending"])
+    qcol3.metric("Sent", counts["sent"])
+    qcol4.metric("Failed", counts["failed"])
     
-    # Move Ship Name to Column A
-    if "Ship Name" in cols_to_keep_unique:
-        cols_to_keep_unique.remove("Ship Name")
-        cols_to_keep_unique = ["Ship Name"] + cols_to_keep_unique
+    records = store.messages(batch_id)
+    if not records.empty:
+        st.dataframe(records.drop(columns=["id"]), use_container_width=True, hide_index=True)
+    if counts["failed"] and st.button("🔁 Retry failed messages", key=f"retry_{batch_id}"):
+        store.retry_failed(batch_id)
 
-    failed = failed[cols_to_keep_unique]
 
-    return failed, df
+@st.cache_data(show_spinner=False, max_entries=8)
+def excel_export(_df, data_key, sheet_name, _extra_sheets=None):
+    """Excel bytes for a dataset, built once per upload instead of on every rerun"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        _df.to_excel(writer, index=False, sheet_name=sheet_name)
+        for extra_name, extra_df in (_extra_sheets or {}).items():
+            extra_df.to_excel(writer, index=False, sheet_name=extra_name)
+    return output.getvalue()
 
 
-def send_email(smtp_server, smtp_port, sender_email, sender_password, 
-               recipient_emails, subject, body, attachment_data=None, 
-               attachment_name="Failed_Validation.xlsx", cc_emails=None):
-    """Send email with optional attachment to multiple recipients"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        
-        # Handle recipient emails
-        if isinstance(recipient_emails, str):
-            recipient_list = [email.strip() for email in recipient_emails.split(',') if email.strip()]
-        else:
-            recipient_list = recipient_emails
-        
-        msg['To'] = ', '.join(recipient_list)
-        
-        # Handle CC emails
-        cc_list = []
-        if cc_emails:
-            if isinstance(cc_emails, str):
-                cc_list = [email.strip() for email in cc_emails.split(',') if email.strip()]
-            else:
-                cc_list = cc_emails
-            if cc_list:
-                msg['Cc'] = ', '.join(cc_list)
-        
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        # Attach file if provided
-        if attachment_data:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment_data.getvalue())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename={attachment_name}')
-            msg.attach(part)
-        
-        # Combine To and CC for actual sending
-        all_recipients = recipient_list + cc_list
-        
-        # Connect and send
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, all_recipients, msg.as_string())
-        server.quit()
-        
-        return True, "Email sent successfully!"
-    except Exception as e:
-        return False, f"Failed to send email: {str(e)}"
+@st.cache_data(show_spinner=False, max_entries=8)
+def voyage_kpis(_df, data_key):
+    """Voyage KPI table, computed once per upload (data_key is the content hash)"""
+    return kpi.voyage_kpis(_df)
 
 
-def create_email_body(ship_name, failed_count, reasons_summary):
-    """Create HTML email body"""
-    body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <h2 style="color: #2c3e50;">Vessel Report Validation Alert</h2>
-            
-            <p>Dear Captain and C/E of <strong>{ship_name}</strong>,</p>
-            
-            <p>This is an automated notification regarding recent validation failures in your vessel reports.</p>
-            
-            <div style="background-color: #fff3cd; border-left: 4px solid #ffc107; padding: 15px; margin: 20px 0;">
-                <h3 style="margin-top: 0; color: #856404;">Validation Summary</h3>
-                <p><strong>Failed Reports:</strong> {failed_count}</p>
-            </div>
-            
-            <h3>Common Issues Detected:</h3>
-            <ul>
-    {reasons_summary}
-            </ul>
-            
-            <p>Please review the attached Excel file for detailed information about the failed validations.</p>
-            
-            <h4 style="color: #2c3e50;">Action Required:</h4>
-            <ol>
-                <li>Review the attached report carefully</li>
-                <li>Correct the identified issues</li>
-                <li>Resubmit corrected reports</li>
-                <li>Contact the technical team if you need assistance</li>
-            </ol>
-            
-            <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
-            
-            <p style="color: #7f8c8d; font-size: 0.9em;">
-                For any queries, please contact us at <strong><a href="mailto:smartapp@enginelink.blue">smartapp@enginelink.blue</a></strong>
-            </p>
-            
-            <p style="color: #7f8c8d; font-size: 0.85em; margin-top: 10px;">
-                This is an automated message. Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}
-            </p>
-        </body>
-    </html>
-    """
-    return body
+@st.cache_data(show_spinner=False, max_entries=8)
+def grid_lookup(_df, data_key):
+    """Filter lookup frame, built once per dataset"""
+    return grid.build_lookup(_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def grid_positions(_df, data_key, filters, sort_by, ascending):
+    """Filtered and sorted row positions, memoized per filter"""
+    positions = grid.filter_positions(grid_lookup(_df, data_key), **dict(filters))
+    return grid.sort_positions(_df, positions, sort_by, ascending)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def grid_page(_df, data_key, filters, sort_by, ascending, page, page_size):
+    """One page of rows, memoized per (filter, page)"""
+    positions = grid_positions(_df, data_key, filters, sort_by, ascending)
+    return grid.page_slice(_df, positions, page, page_size)
+
+
+def render_data_grid(df, data_key, key, height=400):
+    """Filterable, paginated grid that only sends the visible page to the browser"""
+    lookup = grid_lookup(df, data_key)
+    
+    fcol1, fcol2, fcol3, fcol4 = st.columns(4)
+    with fcol1:
+        vessels = st.multiselect(
+            "Vessel",
+            grid.filter_options(lookup, "Ship Name"),
+            key=f"{key}_vessels"
+        )
+    with fcol2:
+        rule_codes = st.multiselect(
+            "Rule",
+            [code for _, code in validation.RULE_CODES if code in lookup.columns],
+            key=f"{key}_rules"
+        )
+    with fcol3:
+        report_types = st.multiselect(
+            "Report Type",
+            grid.filter_options(lookup, "Report Type"),
+            key=f"{key}_report_types"
+        )
+    with fcol4:
+        date_range = st.date_input("Report date range", value=[], key=f"{key}_dates")
+    
+    start_date, end_date = (list(date_range) + [None, None])[:2]
+    filters = (
+        ("vessels", tuple(vessels)),
+        ("rule_codes", tuple(rule_codes)),
+        ("report_types", tuple(report_types)),
+        ("start_date", start_date),
+        ("end_date", end_date),
+    )
+    
+    scol1, scol2, scol3, scol4 = st.columns(4)
+    with scol1:
+        sort_by = st.selectbox("Sort by", ["(none)"] + df.columns.tolist(), key=f"{key}_sort")
+        sort_by = None if sort_by == "(none)" else sort_by
+    with scol2:
+        descending = st.toggle("Descending", key=f"{key}_desc")
+    with scol3:
+        page_size = st.selectbox("Rows per page", grid.PAGE_SIZES, index=1, key=f"{key}_page_size")
+    
+    positions = grid_positions(df, data_key, filters, sort_by, not descending)
+    pages = grid.page_count(len(positions), page_size)
+    # Keep the page in range when filters shrink the result
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    with scol4:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key=f"{key}_page")
+    
+    page_df = grid_page(df, data_key, filters, sort_by, not descending, int(page), page_size)
+    first_row = (int(page) - 1) * page_size + 1 if len(positions) else 0
+    st.caption(f"Rows {first_row}-{first_row + len(page_df) - 1 if len(page_df) else 0} "
+               f"of {len(positions)} (filtered from {len(df)})")
+    st.dataframe(page_df, use_container_width=True, height=height)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def compare_runs(previous_bytes, previous_name, _current, data_key):
+    """Diff a previous run against the current upload, plus the Excel report"""
+    previous = run_diff.load_results(previous_bytes, previous_name)
+    diff = run_diff.diff_results(previous, _current)
+    return diff, run_diff.diff_report(diff)
+
 
 @st.cache_data(show_spinner=False)
-def process_excel_file(file_bytes, file_name):
+def process_excel_file(file_bytes, file_name, remove_duplicates=True):
     """Process uploaded Excel file and return validation results"""
     # Convert bytes to dataframe
     df = pd.read_excel(io.BytesIO(file_bytes), sheet_name="All Reports")
     
+    # Drop duplicate and superseded reports so they are not validated or emailed twice
+    duplicates = pd.DataFrame()
+    if remove_duplicates:
+        df, duplicates = dedup.deduplicate(df)
+        df = df.reset_index(drop=True)
+    
     # Validate reports
     failed, df_with_calcs = validate_reports(df)
     
@@ -426,7 +217,9 @@ def process_excel_file(file_bytes, file_name):
         failed.to_dict('records') if not failed.empty else [],
         failed.columns.tolist() if not failed.empty else [],
         df_with_calcs.to_dict('records'),
-        df_with_calcs.columns.tolist()
+        df_with_calcs.columns.tolist(),
+        duplicates.to_dict('records'),
+        duplicates.columns.tolist()
     )
 
 
@@ -437,6 +230,9 @@ def main():
         layout="wide"
     )
     
+    if startup.PREWARM_ENABLED:
+        prewarm_once()
+    
     # Initialize session state
     if 'validation_done' not in st.session_state:
         st.session_state.validation_done = False
@@ -446,6 +242,10 @@ def main():
         st.session_state.df_with_calcs = None
     if 'original_df' not in st.session_state:
         st.session_state.original_df = None
+    if 'duplicates_df' not in st.session_state:
+        st.session_state.duplicates_df = None
+    if 'outbox_batch_id' not in st.session_state:
+        st.session_state.outbox_batch_id = None
     
     st.title("🚢 Ship Report Validation System")
     st.markdown("Upload your Excel file to validate ship reports and send automated alerts")
@@ -453,39 +253,7 @@ def main():
     # Sidebar with validation rules and email settings
     with st.sidebar:
         st.header("📋 Validation Rules")
-        st.markdown("""
-        **Rule 1: SFOC (Specific Fuel Oil Consumption)**
-        - At Sea (ME Rhrs > 12): 150–200 g/kWh
-        - At Port/Anchorage: No validation
-        
-        **Rule 2: Average Speed**
-        - At Sea (ME Rhrs > 12): 0–20 knots
-        - At Port/Anchorage: No validation
-        
-        **Rule 3: Exhaust Temperature**
-        - At Sea (ME Rhrs > 12): Deviation ≤ ±50°C from average
-        - Applies to Units 1-16
-        - At Port/Anchorage: No validation
-        
-        **Rule 4: ME Running Hours**
-        - ME Rhrs must not exceed Report Hours by more than 1 hour
-        - Tolerance: ±1 hour margin
-        
-        **Rule 5: Auxiliary Engines & Sub-Consumers**
-        - At Sea with ME Load > 40%
-        - If AE Rhrs/Report Hours > 1.25 (indicating 2+ AEs running)
-        - All sub-consumers must not be zero
-        - Validates proper reporting of tank cleaning, cargo operations, etc.
-        
-        **Rule 6: SCOC (Specific Cylinder Oil Consumption)**
-        - At Sea (ME Rhrs > 12): 0.8–1.5 g/kWh
-        - Formula: [Cyl. Oil Cons. [Ltrs] × 1000] / [Average Load [kW] × ME Rhrs]
-        - Flags if lower or higher than normal range
-        - At Port/Anchorage: No validation
-        
-        **Report Hours Calculation**
-        - Calculated as: (End Date/Time - Start Date/Time) + Time Shift
-        """)
+        st.markdown(config.VALIDATION_RULES_MD)
         
         st.divider()
         
@@ -497,6 +265,31 @@ def main():
             sender_email = st.text_input("Sender Email", placeholder="your-email@company.com")
             sender_password = st.text_input("Password", type="password", 
                                            help="Use App Password for Gmail")
+        
+        # Resume delivery of anything this account left queued, e.g. before an app
+        # restart; the worker runs once per process, whichever session starts it
+        if sender_email and sender_password and get_outbox().status_counts(sender=sender_email)["queued"]:
+            get_delivery_worker(smtp_server, int(smtp_port), sender_email, sender_password)
+        
+        st.divider()
+        
+        st.header("🧹 Duplicates")
+        remove_duplicates = st.checkbox(
+            "Remove duplicate reports before validation", value=True,
+            help="Same IMO, start/end date and time and report type: the last one in the file is kept"
+        )
+        
+        st.divider()
+        
+        st.header("🗄️ History")
+        save_history = st.checkbox("Save results to history database", value=True,
+                                   help=f"Stored locally in {history.DEFAULT_DB_PATH}")
+        
+        startup_timings = startup.timings()
+        if startup_timings:
+            st.caption("⏱️ Since process start: " + ", ".join(
+                f"{event.replace('_', ' ')} {seconds:.2f}s" for event, seconds in startup_timings.items()
+            ))
     
     # File uploader
     uploaded_file = st.file_uploader(
@@ -507,8 +300,13 @@ def main():
     
     # Reset validation when new file is uploaded
     if uploaded_file is not None:
-        # Create a unique identifier for the file
-        file_id = f"{uploaded_file.name}_{uploaded_file.size}"
+        # Identify the upload by content: it keys the per-upload caches, which are
+        # shared across sessions, so a re-export with the same name and size
+        # must not reuse them. Hashed once per upload, not on every rerun.
+        if st.session_state.get('upload_ref') != uploaded_file.file_id:
+            st.session_state.upload_ref = uploaded_file.file_id
+            st.session_state.upload_digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        file_id = f"{st.session_state.upload_digest}_{'dedup' if remove_duplicates else 'all'}"
         
         # Check if this is a new file
         if 'current_file_id' not in st.session_state or st.session_state.current_file_id != file_id:
@@ -517,6 +315,7 @@ def main():
             st.session_state.failed_df = None
             st.session_state.df_with_calcs = None
             st.session_state.original_df = None
+            st.session_state.duplicates_df = None
     
     # Run validation only once when file is uploaded
     if uploaded_file is not None and not st.session_state.validation_done:
@@ -527,21 +326,31 @@ def main():
             
             # Process file with caching
             with st.spinner("Loading and validating file..."):
-                df_data, df_cols, failed_data, failed_cols, calc_data, calc_cols = process_excel_file(file_bytes, file_name)
+                (df_data, df_cols, failed_data, failed_cols, calc_data, calc_cols,
+                 dup_data, dup_cols) = process_excel_file(file_bytes, file_name, remove_duplicates)
                 
                 # Convert back to DataFrames
                 df = pd.DataFrame(df_data, columns=df_cols)
                 failed = pd.DataFrame(failed_data, columns=failed_cols) if failed_data else pd.DataFrame()
                 df_with_calcs = pd.DataFrame(calc_data, columns=calc_cols)
+                duplicates = pd.DataFrame(dup_data, columns=dup_cols)
                 
                 # Store in session state
                 st.session_state.original_df = df
                 st.session_state.failed_df = failed
                 st.session_state.df_with_calcs = df_with_calcs
+                st.session_state.duplicates_df = duplicates
                 st.session_state.validation_done = True
             
+            startup.mark("first_result")
             st.success(f"✅ File loaded and validated! Total rows: {len(df)}")
             
+            if save_history:
+                saved = get_history_store().upsert(df_with_calcs, source_file=file_name)
+                history_stats.clear()
+                history_vessel_names.clear()
+                st.caption(f"🗄️ Saved {saved} reports to history")
+            
         except Exception as e:
             st.error(f"❌ Error processing file: {str(e)}")
             st.exception(e)
@@ -571,12 +380,27 @@ def main():
             pass_rate = ((len(df) - len(failed)) / len(df) * 100) if len(df) > 0 else 0
             st.metric("Pass Rate", f"{pass_rate:.1f}%")
         
+        duplicates = st.session_state.duplicates_df
+        if duplicates is not None and not duplicates.empty:
+            dup_counts = dedup.duplicate_summary(duplicates)
+            st.info(f"🧹 Removed {len(duplicates)} duplicate reports before validation "
+                    f"({dup_counts[dedup.EXACT]} exact, {dup_counts[dedup.RESUBMITTED]} superseded by a resubmission)")
+            with st.expander("🧹 Removed Duplicate Reports"):
+                st.caption("'Duplicate Of' is the row number (from 0, in the uploaded file) of the report that was kept")
+                st.dataframe(duplicates, use_container_width=True)
+                st.download_button(
+                    label="📥 Download Removed Duplicates",
+                    data=excel_export(duplicates, f"{st.session_state.current_file_id}:duplicates", "Duplicates"),
+                    file_name="Removed_Duplicates.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+        
         if not failed.empty:
             st.warning(f"⚠️ {len(failed)} reports failed validation")
             
             # Show failed reports
             st.subheader("Failed Reports")
-            st.dataframe(failed, use_container_width=True, height=400)
+            render_data_grid(failed, f"{st.session_state.current_file_id}:failed", "failed_grid")
             
             # Failure reasons summary
             with st.expander("📊 Failure Reasons Summary"):
@@ -591,10 +415,11 @@ def main():
                     st.write(reason_counts)
             
             # Create Excel file for download/email
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                failed.to_excel(writer, index=False, sheet_name="Failed_Validation")
-            output.seek(0)
+            voyage_table = voyage_kpis(df_with_calcs, f"{st.session_state.current_file_id}:all")
+            output = excel_export(
+                failed, f"{st.session_state.current_file_id}:failed+kpis", "Failed_Validation",
+                {"Voyage_KPIs": voyage_table} if not voyage_table.empty else None
+            )
             
             # Download button
             st.download_button(
@@ -644,31 +469,13 @@ def main():
                             # Filter failed reports for this vessel
                             vessel_failed = failed[failed["Ship Name"] == selected_vessel]
                             
-                            # Create vessel-specific Excel
-                            vessel_output = io.BytesIO()
-                            with pd.ExcelWriter(vessel_output, engine='openpyxl') as writer:
-                                vessel_failed.to_excel(writer, index=False, 
-                                                      sheet_name="Failed_Validation")
-                            vessel_output.seek(0)
-                            
-                            # Prepare reasons summary
-                            vessel_reasons = []
-                            for reason_str in vessel_failed["Reason"]:
-                                if reason_str:
-                                    vessel_reasons.extend(reason_str.split("; "))
-                            
-                            reasons_html = ""
-                            if vessel_reasons:
-                                reason_counts = pd.Series(vessel_reasons).value_counts()
-                                for reason, count in reason_counts.items():
-                                    reasons_html += f"<li>{reason} ({count} occurrence{'s' if count > 1 else ''})</li>\n"
-                            
-                            # Create email
-                            subject = f"Vessel Report Validation Alert - {selected_vessel}"
-                            body = create_email_body(selected_vessel, len(vessel_failed), reasons_html)
+                            # Build subject, body and vessel-specific Excel
+                            subject, body, vessel_output = notifications.vessel_notification(
+                                selected_vessel, vessel_failed
+                            )
                             
                             with st.spinner("Sending email..."):
-                                success, message = send_email(
+                                success, message = notifications.send_email(
                                     smtp_server, smtp_port, sender_email, sender_password,
                                     vessel_email, subject, body, vessel_output,
                                     f"Failed_Validation_{selected_vessel}.xlsx",
@@ -709,9 +516,6 @@ def main():
                             elif "Email" not in email_df.columns and "To" not in email_df.columns:
                                 st.error("❌ Email mapping file must have 'Email' or 'To' column")
                             else:
-                                # Determine the email column name
-                                email_col = "Email" if "Email" in email_df.columns else "To"
-                                
                                 # Detect CC columns
                                 cc_columns = [col for col in email_df.columns if col.upper().startswith('CC')]
                                 if cc_columns:
@@ -721,84 +525,52 @@ def main():
                                     if not sender_email or not sender_password:
                                         st.error("Please configure SMTP settings in the sidebar")
                                     else:
+                                        # Spool every message first; the delivery worker sends them
+                                        # in the background, so closing the tab does not stop the run
+                                        store = get_outbox()
+                                        # Unique even when two sessions send in the same second
+                                        batch_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
                                         progress_bar = st.progress(0)
-                                        status_container = st.container()
                                         
                                         results = []
                                         for idx, vessel in enumerate(vessels):
-                                            # Get vessel email row
-                                            vessel_email_row = email_df[email_df["Ship Name"] == vessel]
-                                            
-                                            if vessel_email_row.empty:
+                                            # To and CC addresses from the mapping (same lookup as the watcher)
+                                            vessel_recipients = notifications.mapping_recipients(email_df, vessel)
+                                            if vessel_recipients is None:
                                                 results.append(f"❌ {vessel}: No email found in mapping")
                                                 continue
+                                            vessel_email, cc_emails_list = vessel_recipients
                                             
-                                            # Get primary email(s)
-                                            vessel_email = vessel_email_row.iloc[0][email_col]
-                                            
-                                            # Skip if no email
-                                            if pd.isna(vessel_email) or str(vessel_email).strip() == "":
-                                                results.append(f"❌ {vessel}: Email is empty")
-                                                continue
-                                            
-                                            # Collect all CC emails from CC columns
-                                            cc_emails_list = []
-                                            for cc_col in cc_columns:
-                                                cc_val = vessel_email_row.iloc[0].get(cc_col)
-                                                if pd.notna(cc_val) and str(cc_val).strip():
-                                                    cc_emails_list.extend([e.strip() for e in str(cc_val).split(',') if e.strip()])
-                                            
-                                            # Combine CC emails
-                                            cc_emails_str = ', '.join(cc_emails_list) if cc_emails_list else None
-                                            
-                                            # Filter and create report
+                                            # Filter and build the full message with attachment
                                             vessel_failed = failed[failed["Ship Name"] == vessel]
-                                            vessel_output = io.BytesIO()
-                                            with pd.ExcelWriter(vessel_output, engine='openpyxl') as writer:
-                                                vessel_failed.to_excel(writer, index=False, 
-                                                                      sheet_name="Failed_Validation")
-                                            vessel_output.seek(0)
-                                            
-                                            # Prepare reasons
-                                            vessel_reasons = []
-                                            for reason_str in vessel_failed["Reason"]:
-                                                if reason_str:
-                                                    vessel_reasons.extend(reason_str.split("; "))
-                                            
-                                            reasons_html = ""
-                                            if vessel_reasons:
-                                                reason_counts = pd.Series(vessel_reasons).value_counts()
-                                                for reason, count in reason_counts.items():
-                                                    reasons_html += f"<li>{reason} ({count} occurrence{'s' if count > 1 else ''})</li>\n"
-                                            
-                                            # Send email
-                                            subject = f"Vessel Report Validation Alert - {vessel}"
-                                            body = create_email_body(vessel, len(vessel_failed), reasons_html)
-                                            
-                                            success, message = send_email(
-                                                smtp_server, smtp_port, sender_email, sender_password,
-                                                vessel_email, subject, body, vessel_output,
+                                            subject, body, vessel_output = notifications.vessel_notification(vessel, vessel_failed)
+                                            message, recipients = notifications.build_message(
+                                                sender_email, vessel_email, subject, body, vessel_output,
                                                 f"Failed_Validation_{vessel}.xlsx",
-                                                cc_emails=cc_emails_str
+                                                cc_emails=cc_emails_list or None
                                             )
+                                            store.enqueue(message, sender_email, recipients,
+                                                          vessel=vessel, batch_id=batch_id)
                                             
-                                            if success:
-                                                cc_info = f" (CC: {len(cc_emails_list)} recipients)" if cc_emails_list else ""
-                                                results.append(f"✅ {vessel}: Email sent successfully{cc_info}")
-                                            else:
-                                                results.append(f"❌ {vessel}: {message}")
+                                            cc_info = f" (CC: {len(cc_emails_list)} recipients)" if cc_emails_list else ""
+                                            results.append(f"📥 {vessel}: Queued for delivery{cc_info}")
                                             
                                             progress_bar.progress((idx + 1) / len(vessels))
                                         
-                                        with status_container:
-                                            st.subheader("Email Sending Results")
-                                            for result in results:
-                                                st.write(result)
+                                        get_delivery_worker(smtp_server, int(smtp_port), sender_email, sender_password)
+                                        st.session_state.outbox_batch_id = batch_id
+                                        
+                                        st.subheader("Queued Emails")
+                                        for result in results:
+                                            st.write(result)
                             
                         except Exception as e:
                             st.error(f"Error loading email mapping: {str(e)}")
                     else:
                         st.info("👆 Upload a vessel email mapping file to enable bulk sending")
+                    
+                    if st.session_state.outbox_batch_id:
+                        show_outbox_status(st.session_state.outbox_batch_id)
             else:
                 st.warning("⚠️ 'Ship Name' column not found. Cannot send vessel-specific emails.")
         
@@ -808,13 +580,10 @@ def main():
         
         # Option to view all data with SFOC, SCOC and Report Hours
         with st.expander("🔍 View All Data (with calculated SFOC, SCOC and Report Hours)"):
-            st.dataframe(df_with_calcs, use_container_width=True, height=400)
+            render_data_grid(df_with_calcs, f"{st.session_state.current_file_id}:all", "all_grid")
             
             # Download all data
-            output_all = io.BytesIO()
-            with pd.ExcelWriter(output_all, engine='openpyxl') as writer:
-                df_with_calcs.to_excel(writer, index=False, sheet_name="All_Reports_Processed")
-            output_all.seek(0)
+            output_all = excel_export(df_with_calcs, f"{st.session_state.current_file_id}:all", "All_Reports_Processed")
             
             st.download_button(
                 label="📥 Download All Data with Calculations",
@@ -822,6 +591,83 @@ def main():
                 file_name="All_Reports_With_Calculations.xlsx",
                 mime="application/vnd.openxmlx-officedocument.spreadsheetml.sheet"
             )
+        
+        # Fuel, SFOC/SCOC and distance efficiency per voyage
+        with st.expander("🧭 Voyage KPIs"):
+            voyage_table = voyage_kpis(df_with_calcs, f"{st.session_state.current_file_id}:all")
+            if voyage_table.empty:
+                st.info("No 'Voyage Number' column found in this file")
+            else:
+                st.caption("Weighted SFOC/SCOC = total ME fuel or cylinder oil / total ME energy (load x running hours); "
+                           "fuel per NM uses total ME fuel (ME Cons 1-3)")
+                st.dataframe(voyage_table, use_container_width=True)
+                st.download_button(
+                    label="📥 Download Voyage KPIs",
+                    data=excel_export(voyage_table, f"{st.session_state.current_file_id}:kpis", "Voyage_KPIs"),
+                    file_name="Voyage_KPIs.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+        
+        # Cylinder-level exhaust diagnostics across the whole upload
+        with st.expander("🔥 Exhaust Temperature Diagnostics (Main Engine Units 1-16)"):
+            heatmap, trend, summary = exhaust_diagnostics(df_with_calcs, f"{st.session_state.current_file_id}:all")
+            if heatmap.empty:
+                st.info("No exhaust temperature columns found in this file")
+            else:
+                st.markdown("**Mean absolute deviation from cylinder average [°C] per vessel**")
+                st.dataframe(heatmap.round(1), use_container_width=True)
+                
+                st.markdown("**Exhaust temperature trend per vessel and unit [°C/day]**")
+                st.dataframe(trend.round(3), use_container_width=True)
+                
+                st.markdown("**Max spread (hottest - coldest unit) per report, 10°C bins**")
+                st.bar_chart(summary["Exh. Temp Max Spread [°C]"].dropna().round(-1).value_counts().sort_index())
+                
+                st.markdown("**Reports with the largest single-unit deviation**")
+                worst = summary["Exh. Temp Worst Deviation [°C]"].abs().nlargest(20).index
+                context = [c for c in ["Ship Name", "Report Type", "Start Date", "End Date"] if c in df_with_calcs.columns]
+                st.dataframe(
+                    df_with_calcs.loc[worst, context].join(summary.loc[worst].round(1)),
+                    use_container_width=True
+                )
+        
+        # New / resolved / persisting failures against an earlier upload
+        with st.expander("🔁 Compare With Previous Run"):
+            previous_file = st.file_uploader(
+                "Previous data dump or Failed_Validation export",
+                type=["xlsx", "xls", "csv", "parquet"],
+                key="previous_run_file",
+                help="Failures are matched by report identity (IMO, dates/times, report type) and rule"
+            )
+            if previous_file is not None:
+                try:
+                    with st.spinner("Comparing runs..."):
+                        diff, diff_xlsx = compare_runs(
+                            previous_file.getvalue(), previous_file.name, df_with_calcs,
+                            f"{st.session_state.current_file_id}:all"
+                        )
+                    counts = run_diff.status_counts(diff)
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("🆕 New", int(counts[run_diff.NEW]))
+                    col2.metric("⏳ Persisting", int(counts[run_diff.PERSISTING]))
+                    col3.metric("✅ Resolved", int(counts[run_diff.RESOLVED]))
+                    
+                    st.markdown("**Failures per vessel**")
+                    st.dataframe(run_diff.per_vessel_counts(diff), use_container_width=True)
+                    
+                    statuses = st.multiselect("Status", run_diff.STATUS_ORDER,
+                                              default=[run_diff.NEW, run_diff.RESOLVED], key="diff_status")
+                    st.dataframe(diff[diff["Status"].isin(statuses)].drop(columns=["report_key"]),
+                                 use_container_width=True, height=400)
+                    
+                    st.download_button(
+                        label="📥 Download Run Comparison",
+                        data=diff_xlsx,
+                        file_name="Validation_Diff.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
+                except Exception as e:
+                    st.error(f"❌ Error comparing runs: {str(e)}")
     
     elif uploaded_file is None:
         st.info("👆 Please upload an Excel file to begin validation")
@@ -872,6 +718,48 @@ def main():
             - Check your email provider's SMTP settings
             - Most use port 587 with TLS encryption
             """)
+    
+    # History queries work without an upload
+    st.divider()
+    st.header("🗄️ Validation History")
+    store = get_history_store()
+    stats = history_stats()
+    if stats["reports"] == 0:
+        st.info("No validated reports stored yet")
+    else:
+        st.caption(f"{stats['reports']} reports ({stats['failed']} failed) "
+                   f"from {stats['first_date']} to {stats['last_date']}")
+        
+        with st.form("history_query_form"):
+            hcol1, hcol2 = st.columns(2)
+            with hcol1:
+                history_vessels = st.multiselect(
+                    "Vessels", history_vessel_names()
+                )
+                history_rules = st.multiselect(
+                    "Rules", [code for _, code in validation.RULE_CODES] + ["OTHER"]
+                )
+            with hcol2:
+                first = pd.Timestamp(stats["first_date"]).date() if stats["first_date"] else None
+                last = pd.Timestamp(stats["last_date"]).date() if stats["last_date"] else None
+                history_range = st.date_input("Report date range", value=(first, last) if first else ())
+                history_group = st.multiselect(
+                    "Group by", ["vessel", "imo", "rule", "month", "date"], default=["vessel", "rule"]
+                )
+            query_button = st.form_submit_button("🔎 Query History")
+        
+        if query_button:
+            start_date, end_date = (list(history_range) + [None, None])[:2]
+            counts = store.failure_counts(
+                group_by=history_group,
+                ship_names=history_vessels or None,
+                start_date=start_date,
+                end_date=end_date,
+                rule_codes=history_rules or None,
+            )
+            st.dataframe(counts, use_container_width=True)
+            if len(history_group) == 1 and not counts.empty:
+                st.bar_chart(counts.set_index(history_group[0])["failures"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""Static configuration: column lists, rule codes and rule descriptions.
+
+Kept in its own module so it is built once per process instead of on every
+Streamlit rerun or validate_reports call.
+"""
+
+NUMERIC_COLS = [
+    "Average Load [kW]",
+    "ME Rhrs (From Last Report)",
+    "Avg. Speed",
+    "Fuel Cons. [MT] (ME Cons 1)",
+    "Fuel Cons. [MT] (ME Cons 2)",
+    "Fuel Cons. [MT] (ME Cons 3)",
+    "Time Shift",
+    "Average Load [%]",
+    "A.E. 1 Last Report [Rhrs] (Aux Engine Unit 1)",
+    "A.E. 2 Last Report [Rhrs] (Aux Engine Unit 2)",
+    "A.E. 3 Last Report [Rhrs] (Aux Engine Unit 3)",
+    "A.E. 4 Total [Rhrs] (Aux Engine Unit 4)",
+    "A.E. 5 Last Report [Rhrs] (Aux Engine Unit 5)",
+    "A.E. 6 Last Report [Rhrs] (Aux Engine Unit 6)",
+    "Tank Cleaning [MT]",
+    "Cargo Transfer [MT]",
+    "Maintaining Cargo Temp. [MT]",
+    "Shaft Gen. Propulsion [MT]",
+    "Raising Cargo Temp. [MT]",
+    "Burning Sludge [MT]",
+    "Ballast Transfer [MT]",
+    "Fresh Water Prod. [MT]",
+    "Others [MT]",
+    "EGCS Consumption [MT]",
+    "Cyl. Oil Cons. [Ltrs]"  # Added for SCOC calculation
+]
+
+AE_RHRS_COLS = [
+    "A.E. 1 Last Report [Rhrs] (Aux Engine Unit 1)",
+    "A.E. 2 Last Report [Rhrs] (Aux Engine Unit 2)",
+    "A.E. 3 Last Report [Rhrs] (Aux Engine Unit 3)",
+    "A.E. 4 Total [Rhrs] (Aux Engine Unit 4)",
+    "A.E. 5 Last Report [Rhrs] (Aux Engine Unit 5)",
+    "A.E. 6 Last Report [Rhrs] (Aux Engine Unit 6)",
+]
+
+SUB_CONSUMER_COLS = [
+    "Tank Cleaning [MT]",
+    "Cargo Transfer [MT]",
+    "Maintaining Cargo Temp. [MT]",
+    "Shaft Gen. Propulsion [MT]",
+    "Raising Cargo Temp. [MT]",
+    "Burning Sludge [MT]",
+    "Ballast Transfer [MT]",
+    "Fresh Water Prod. [MT]",
+    "Others [MT]",
+    "EGCS Consumption [MT]",
+]
+
+# Always shown in the failed sheet (Ship Name first)
+CONTEXT_COLS = [
+    "Ship Name",
+    "IMO_No",
+    "Report Type",
+    "Start Date",
+    "Start Time",
+    "End Date",
+    "End Time",
+    "Voyage Number",
+    "Time Zone",
+    "Distance - Ground [NM]",
+    "Time Shift",
+    "Distance - Sea [NM]",
+    "Average Load [kW]",
+    "Average RPM",
+    "Average Load [%]",
+    "ME Rhrs (From Last Report)",
+    "Report Hours",
+    "Cyl. Oil Cons. [Ltrs]",  # Added for SCOC context
+    "SCOC",  # Added calculated SCOC column
+]
+
+REPORT_IDENTITY_COLS = [
+    "IMO_No",
+    "Start Date",
+    "Start Time",
+    "End Date",
+    "End Time",
+    "Report Type",
+]
+
+RULE_CODES = [
+    ("SFOC out of", "R1_SFOC"),
+    ("Avg. Speed out of", "R2_SPEED"),
+    ("Exhaust temp deviation", "R3_EXHAUST"),
+    ("ME Rhrs (", "R4_ME_RHRS"),
+    ("Multiple Aux Engines", "R5_AUX_ENGINES"),
+    ("SCOC (", "R6_SCOC"),
+]
+
+VALIDATION_RULES_MD = """
+**Rule 1: SFOC (Specific Fuel Oil Consumption)**
+- At Sea (ME Rhrs > 12): 150–200 g/kWh
+- At Port/Anchorage: No validation
+
+**Rule 2: Average Speed**
+- At Sea (ME Rhrs > 12): 0–20 knots
+- At Port/Anchorage: No validation
+
+**Rule 3: Exhaust Temperature**
+- At Sea (ME Rhrs > 12): Deviation ≤ ±50°C from average
+- Applies to Units 1-16
+- At Port/Anchorage: No validation
+
+**Rule 4: ME Running Hours**
+- ME Rhrs must not exceed Report Hours by more than 1 hour
+- Tolerance: ±1 hour margin
+
+**Rule 5: Auxiliary Engines & Sub-Consumers**
+- At Sea with ME Load > 40%
+- If AE Rhrs/Report Hours > 1.25 (indicating 2+ AEs running)
+- All sub-consumers must not be zero
+- Validates proper reporting of tank cleaning, cargo operations, etc.
+
+**Rule 6: SCOC (Specific Cylinder Oil Consumption)**
+- At Sea (ME Rhrs > 12): 0.8–1.5 g/kWh
+- Formula: [Cyl. Oil Cons. [Ltrs] × 1000] / [Average Load [kW] × ME Rhrs]
+- Flags if lower or higher than normal range
+- At Port/Anchorage: No validation
+
+**Report Hours Calculation**
+- Calculated as: (End Date/Time - Start Date/Time) + Time Shift
+"""
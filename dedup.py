@@ -0,0 +1,104 @@
+"""Duplicate and resubmitted report detection.
+
+Each row gets two 64-bit hashes: one over its report identity (IMO, start
+and end date/time, report type, normalized as in validation.report_identity)
+and one over its measurement columns. Rows sharing an identity are the same
+noon report; the last one in the file is kept. A dropped row whose
+measurements match the kept one is an exact duplicate, otherwise it is an
+earlier version of a resubmitted report. Everything is hash-indexed, so the
+pass is linear in the number of rows.
+
+Check the examples with: python -m doctest dedup.py
+"""
+import numpy as np
+import pandas as pd
+
+import config
+import exhaust
+import validation
+
+
+EXACT, RESUBMITTED = "exact", "resubmitted"
+EXTRA_MEASUREMENT_COLS = ["Distance - Sea [NM]", "Distance - Ground [NM]", "Average RPM"]
+
+
+def measurement_columns(df):
+    """Measurement columns present in df (numeric inputs, distances, exhaust units)"""
+    _, exhaust_cols = exhaust.exhaust_columns(df)
+    cols = config.NUMERIC_COLS + EXTRA_MEASUREMENT_COLS + exhaust_cols
+    return [c for c in dict.fromkeys(cols) if c in df.columns]
+
+
+def content_fingerprint(df):
+    """64-bit hash of each row's measurement values"""
+    cols = measurement_columns(df)
+    if not cols:
+        return pd.Series(np.zeros(len(df), dtype="uint64"), index=df.index)
+    block = {}
+    for col in cols:
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            # "8,000", "8000" and 8000 are the same reading, as in validate_reports
+            values = pd.to_numeric(values.astype(str).str.replace(",", "").str.strip(), errors="coerce")
+        block[col] = values.astype("float64")
+    return pd.util.hash_pandas_object(pd.DataFrame(block, index=df.index), index=False)
+
+
+def find_duplicates(df):
+    """Per-row duplicate flags: "Duplicate" ("", exact, resubmitted) and "Duplicate Of" (kept row label)
+
+    Vessels without an IMO are told apart by ship name; rows naming no
+    vessel at all are never treated as duplicates.
+
+    >>> reports = pd.DataFrame({
+    ...     "Ship Name": ["A", "B", "B", None, None], "IMO_No": [None] * 5,
+    ...     "Start Date": ["2024-01-01"] * 5, "End Date": ["2024-01-02"] * 5,
+    ...     "Report Type": ["At Sea"] * 5,
+    ...     "Average Load [kW]": ["8,000", "8,000", "9,500", "8,000", "8,000"],
+    ... })
+    >>> find_duplicates(reports)["Duplicate"].tolist()
+    ['', 'resubmitted', '', '', '']
+    """
+    n = len(df)
+    flags = pd.DataFrame({"Duplicate": "", "Duplicate Of": pd.Series(df.index, index=df.index)},
+                         index=df.index)
+    if n == 0:
+        return flags
+
+    identity = validation.report_identity(df)
+    identity_hash = pd.util.hash_pandas_object(identity, index=False).to_numpy()
+    content_hash = content_fingerprint(df).to_numpy()
+    blank = (identity["IMO_No"] == "").to_numpy()
+
+    kept = blank | ~pd.Series(identity_hash).duplicated(keep="last").to_numpy()
+    removed = ~kept
+    if not removed.any():
+        return flags
+
+    # Position of the kept (last) row for every identity
+    kept_positions = np.flatnonzero(kept & ~blank)
+    lookup = pd.Index(identity_hash[kept_positions])
+    kept_for = kept_positions[lookup.get_indexer(identity_hash[removed])]
+
+    removed_positions = np.flatnonzero(removed)
+    duplicate = np.where(content_hash[removed_positions] == content_hash[kept_for], EXACT, RESUBMITTED)
+    flags.iloc[removed_positions, 0] = duplicate
+    flags.iloc[removed_positions, 1] = df.index[kept_for]
+    return flags
+
+
+def deduplicate(df):
+    """Return (deduplicated df, removed rows with Duplicate / Duplicate Of columns)"""
+    flags = find_duplicates(df)
+    is_duplicate = (flags["Duplicate"] != "").to_numpy()
+    removed = df[is_duplicate].copy()
+    removed.insert(0, "Duplicate", flags.loc[is_duplicate, "Duplicate"])
+    removed.insert(1, "Duplicate Of", flags.loc[is_duplicate, "Duplicate Of"])
+    return df[~is_duplicate], removed
+
+
+def duplicate_summary(removed):
+    """Removed-row counts per duplicate type"""
+    if removed is None or removed.empty:
+        return pd.Series(0, index=[EXACT, RESUBMITTED])
+    return removed["Duplicate"].value_counts().reindex([EXACT, RESUBMITTED], fill_value=0)
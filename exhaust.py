@@ -0,0 +1,172 @@
+"""Exhaust temperature analytics for Main Engine units 1-16.
+
+The unit columns are handled as one 2-D float array (reports x units) so the
+Rule 3 check and the cylinder diagnostics run without per-row Python loops.
+Zero and NaN readings are treated as "not reported" and masked out
+everywhere.
+"""
+import numpy as np
+import pandas as pd
+
+
+EXHAUST_UNITS = range(1, 17)
+EXHAUST_DEVIATION_LIMIT = 50
+
+
+def exhaust_column(unit):
+    """Column name for one Main Engine unit"""
+    return f"Exh. Temp [°C] (Main Engine Unit {unit})"
+
+
+def exhaust_columns(df):
+    """Return (units, column names) for the exhaust columns present in df"""
+    units = [j for j in EXHAUST_UNITS if exhaust_column(j) in df.columns]
+    return units, [exhaust_column(j) for j in units]
+
+
+def exhaust_matrix(df):
+    """Return (units, columns, float matrix) with unreported readings as NaN"""
+    units, cols = exhaust_columns(df)
+    if not cols:
+        return units, cols, np.empty((len(df), 0))
+    block = df[cols]
+    if not all(pd.api.types.is_numeric_dtype(t) for t in block.dtypes):
+        block = block.apply(pd.to_numeric, errors="coerce")
+    # Column-major keeps the per-row reductions over 16 units cache friendly
+    matrix = np.array(block.to_numpy(dtype="float64"), order="F", copy=True)
+    matrix[matrix == 0] = np.nan
+    return units, cols, matrix
+
+
+def masked_mean(matrix):
+    """Row mean over reported units only (NaN where a row has no readings)"""
+    valid = ~np.isnan(matrix)
+    counts = np.count_nonzero(valid, axis=1)
+    totals = np.where(valid, matrix, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / counts
+
+
+def unit_deviation(matrix):
+    """Deviation of each unit from its row's masked mean"""
+    return matrix - masked_mean(matrix)[:, None]
+
+
+def max_spread(matrix):
+    """Hottest minus coldest reported unit per row"""
+    if matrix.shape[1] == 0:
+        return np.full(matrix.shape[0], np.nan)
+    # fmax/fmin skip NaN and give NaN only when the whole row is NaN
+    return np.fmax.reduce(matrix, axis=1) - np.fmin.reduce(matrix, axis=1)
+
+
+def deviation_failures(matrix, rows=None, limit=EXHAUST_DEVIATION_LIMIT):
+    """Boolean matrix of units deviating more than limit from the row mean
+
+    rows optionally restricts the check to a boolean row mask (e.g. At Sea
+    reports with ME Rhrs > 12).
+    """
+    with np.errstate(invalid="ignore"):
+        fails = np.abs(unit_deviation(matrix)) > limit
+    if rows is not None:
+        fails &= np.asarray(rows, dtype=bool)[:, None]
+    return fails
+
+
+def exhaust_summary(df):
+    """Per-report mean, max spread and worst deviating unit as a DataFrame"""
+    units, _, matrix = exhaust_matrix(df)
+    mean = masked_mean(matrix)
+    deviation = matrix - mean[:, None]
+    worst = np.full(len(df), np.nan)
+    worst_dev = np.full(len(df), np.nan)
+    if units:
+        # Unreported units become -1 so argmax skips them without a masked copy
+        abs_dev = np.nan_to_num(np.abs(deviation), nan=-1.0, copy=False)
+        idx = abs_dev.argmax(axis=1)
+        rows = np.arange(len(df))
+        has_reading = abs_dev[rows, idx] >= 0
+        worst = np.where(has_reading, np.asarray(units, dtype="float64")[idx], np.nan)
+        worst_dev = np.where(has_reading, deviation[rows, idx], np.nan)
+    return pd.DataFrame(
+        {
+            "Exh. Temp Mean [°C]": mean,
+            "Exh. Temp Max Spread [°C]": max_spread(matrix),
+            "Exh. Temp Worst Unit": worst,
+            "Exh. Temp Worst Deviation [°C]": worst_dev,
+        },
+        index=df.index,
+    )
+
+
+def _group_codes(df, by):
+    """Sorted integer codes for df[by] and the group keys; rows with a missing key dropped"""
+    codes, keys = pd.factorize(df[by], sort=True)
+    keep = codes >= 0
+    return codes[keep], keep if not keep.all() else None, keys
+
+
+def _unit_sums(codes, n_groups, column, valid, weights=()):
+    """Per-group count of valid readings in one unit column, plus sums of each weights array"""
+    valid_codes = codes[valid]
+    return [np.bincount(valid_codes, minlength=n_groups).astype("float64")] + [
+        np.bincount(valid_codes, weights=w[valid], minlength=n_groups) for w in weights
+    ]
+
+
+def deviation_heatmap(df, by="Ship Name", absolute=True):
+    """Mean (absolute) deviation per group and unit, ready for a heatmap
+
+    Rows are the values of `by`, columns are "Unit 1".."Unit 16".
+    """
+    units, _, matrix = exhaust_matrix(df)
+    deviation = unit_deviation(matrix)
+    if absolute:
+        deviation = np.abs(deviation, out=deviation)
+    unit_labels = [f"Unit {j}" for j in units]
+    if by not in df.columns:
+        return pd.DataFrame(deviation, columns=unit_labels).mean().to_frame("All").T
+
+    codes, keep, keys = _group_codes(df, by)
+    if keep is not None:
+        deviation = deviation[keep]
+    means = np.full((len(keys), len(units)), np.nan)
+    # One bincount per unit column (contiguous in the column-major matrix)
+    for k in range(len(units)):
+        column = deviation[:, k]
+        counts, totals = _unit_sums(codes, len(keys), column, ~np.isnan(column), (column,))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[:, k] = totals / counts
+    return pd.DataFrame(means, index=keys, columns=unit_labels)
+
+
+def unit_trend(df, by="IMO_No", date_col="Start Date"):
+    """Per-vessel per-unit least squares slope of exhaust temp in °C/day
+
+    Computed from grouped sums of x, y, xy and x² (one bincount each per
+    unit) so the whole fleet is handled in one pass. Groups with fewer than
+    two dated readings for a unit get NaN.
+    """
+    units, _, matrix = exhaust_matrix(df)
+    unit_labels = [f"Unit {j}" for j in units]
+    if by not in df.columns or date_col not in df.columns or not units:
+        return pd.DataFrame(columns=unit_labels)
+
+    dates = pd.to_datetime(df[date_col], errors="coerce")
+    days = (dates - pd.Timestamp("1970-01-01")).dt.total_seconds().to_numpy() / 86400.0
+    codes, keep, keys = _group_codes(df, by)
+    if keep is not None:
+        matrix, days = matrix[keep], days[keep]
+    dated = ~np.isnan(days)
+    # Centre x to keep the normal equations well conditioned
+    x = days - (days[dated].mean() if dated.any() else 0.0)
+
+    slopes = np.full((len(keys), len(units)), np.nan)
+    for k in range(len(units)):
+        y = matrix[:, k]
+        n, sx, sy, sxy, sxx = _unit_sums(codes, len(keys), y, dated & ~np.isnan(y), (x, y, x * y, x * x))
+        denom = n * sxx - sx ** 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (n * sxy - sx * sy) / np.where(np.abs(denom) > 1e-12, denom, np.nan)
+        slopes[:, k] = np.where(n >= 2, slope, np.nan)
+    return pd.DataFrame(slopes, index=keys, columns=unit_labels)
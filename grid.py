@@ -0,0 +1,90 @@
+"""Server-side filtering, sorting and paging for the result grids.
+
+The Streamlit grids only ever receive one page of rows. Filtering runs on a
+small per-dataset lookup frame (vessel, report type, date, rule flags) that
+is built once, and the result is a positional index into the full frame, so
+changing page is just an iloc slice.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+import validation
+
+
+PAGE_SIZES = [50, 100, 250, 500, 1000]
+BLANK = "(blank)"
+
+
+def build_lookup(df):
+    """Lightweight frame of the columns the grid filters on"""
+    lookup = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for col in ("Ship Name", "Report Type"):
+        if col in df.columns:
+            values = df[col].fillna("").astype(str).str.strip()
+            lookup[col] = values.where(values != "", BLANK).to_numpy()
+    if "Start Date" in df.columns:
+        lookup["Start Date"] = pd.to_datetime(df["Start Date"], errors="coerce").to_numpy()
+    if "Reason" in df.columns:
+        reasons = df["Reason"].fillna("").astype(str)
+        for prefix, code in validation.RULE_CODES:
+            lookup[code] = reasons.str.contains(
+                r"(?:^|; )" + re.escape(prefix), regex=True
+            ).to_numpy()
+        lookup["Failed"] = (reasons != "").to_numpy()
+    return lookup
+
+
+def filter_options(lookup, col):
+    """Sorted distinct values of a lookup column, for the filter widgets"""
+    if col not in lookup.columns:
+        return []
+    return sorted(lookup[col].unique(), key=str)
+
+
+def filter_positions(lookup, vessels=(), report_types=(), rule_codes=(),
+                     start_date=None, end_date=None):
+    """Row positions matching all given filters (empty filter = no restriction)"""
+    mask = np.ones(len(lookup), dtype=bool)
+    if vessels and "Ship Name" in lookup.columns:
+        mask &= lookup["Ship Name"].isin(vessels).to_numpy()
+    if report_types and "Report Type" in lookup.columns:
+        mask &= lookup["Report Type"].isin(report_types).to_numpy()
+    if rule_codes:
+        codes = [c for c in rule_codes if c in lookup.columns]
+        mask &= lookup[codes].any(axis=1).to_numpy() if codes else False
+    if "Start Date" in lookup.columns:
+        dates = lookup["Start Date"]
+        if start_date is not None:
+            mask &= (dates >= pd.Timestamp(start_date)).to_numpy()
+        if end_date is not None:
+            # Inclusive of the whole end day
+            mask &= (dates < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def sort_positions(df, positions, sort_by=None, ascending=True):
+    """Reorder positions by a column of df (stable, NaN last)"""
+    if not sort_by or sort_by not in df.columns or len(positions) == 0:
+        return positions
+    values = df[sort_by].iloc[positions]
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().sum() >= values.notna().sum():
+        values = numeric
+    else:
+        values = values.astype(str)
+    order = values.reset_index(drop=True).sort_values(
+        ascending=ascending, kind="stable", na_position="last"
+    ).index.to_numpy()
+    return positions[order]
+
+
+def page_count(total, page_size):
+    return max(1, -(-total // page_size))
+
+
+def page_slice(df, positions, page, page_size):
+    """Rows of df for one 1-based page of positions"""
+    start = (page - 1) * page_size
+    return df.iloc[positions[start:start + page_size]]
@@ -0,0 +1,249 @@
+"""Persistent history of validated reports in a local SQLite database.
+
+Every processed upload is upserted by report identity (IMO_No, start/end
+date and time, report type), so the same report revalidated later replaces
+its earlier row instead of being counted twice. Failures are stored one row
+per (report, reason) with a rule code and indexed by vessel, date and rule,
+so fleet/vessel/date-range questions are answered with index lookups rather
+than by reparsing old workbooks.
+"""
+import io
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+import validation
+
+
+DEFAULT_DB_PATH = os.environ.get("VALIDATION_HISTORY_DB", "validation_history.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_key TEXT PRIMARY KEY,
+    imo_no TEXT,
+    ship_name TEXT,
+    report_type TEXT,
+    report_date TEXT,
+    voyage_number TEXT,
+    report_hours REAL,
+    sfoc REAL,
+    scoc REAL,
+    failed INTEGER NOT NULL,
+    reason TEXT,
+    source_file TEXT,
+    validated_at TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reports_imo_date ON reports (imo_no, report_date);
+CREATE INDEX IF NOT EXISTS idx_reports_ship_date ON reports (ship_name, report_date);
+CREATE INDEX IF NOT EXISTS idx_reports_date ON reports (report_date);
+CREATE INDEX IF NOT EXISTS idx_reports_vessel ON reports (ship_name, imo_no);
+
+CREATE TABLE IF NOT EXISTS failures (
+    report_key TEXT NOT NULL REFERENCES reports (report_key) ON DELETE CASCADE,
+    rule_code TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    imo_no TEXT,
+    ship_name TEXT,
+    report_date TEXT,
+    PRIMARY KEY (report_key, rule_code, reason)
+);
+CREATE INDEX IF NOT EXISTS idx_failures_rule_date ON failures (rule_code, report_date);
+CREATE INDEX IF NOT EXISTS idx_failures_imo_date ON failures (imo_no, report_date);
+CREATE INDEX IF NOT EXISTS idx_failures_ship_date ON failures (ship_name, report_date);
+"""
+
+GROUP_COLUMNS = {
+    "vessel": "ship_name",
+    "imo": "imo_no",
+    "rule": "rule_code",
+    "date": "report_date",
+    "month": "substr(report_date, 1, 7)",
+}
+
+
+def _text(df, col):
+    if col not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype="object")
+    values = df[col].astype(str).str.strip()
+    return values.where(~values.isin(["", "nan", "None", "NaT"]), None)
+
+
+def _number(df, col):
+    if col not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype="object")
+    values = pd.to_numeric(df[col], errors="coerce")
+    return values.astype("object").where(values.notna(), None)
+
+
+class HistoryStore:
+    """SQLite-backed store of validation results"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def upsert(self, df_with_calcs, source_file=None):
+        """Insert or replace reports (and their failures) from a validated frame
+
+        df_with_calcs is the second frame returned by validate_reports, which
+        carries the calculated columns and a Reason for every row.
+        Rows that name no vessel (no IMO and no ship name) are skipped, as
+        they cannot be told apart from other vessels' reports.
+        Returns the number of reports written.
+        """
+        if df_with_calcs is None or df_with_calcs.empty:
+            return 0
+
+        identity = validation.report_identity(df_with_calcs)
+        df = df_with_calcs[(identity["IMO_No"] != "").to_numpy()]
+        if df.empty:
+            return 0
+        identity = identity.loc[df.index]
+        keys = validation.report_keys(df)
+        imo = validation.imo_numbers(df)
+        reasons = df["Reason"].fillna("").astype(str) if "Reason" in df.columns else pd.Series("", index=df.index)
+        validated_at = datetime.now().isoformat(timespec="seconds")
+
+        rows = pd.DataFrame({
+            "report_key": keys,
+            "imo_no": imo.where(imo != "", None),
+            "ship_name": _text(df, "Ship Name"),
+            "report_type": _text(df, "Report Type"),
+            "report_date": identity["Start Date"].where(identity["Start Date"] != "", None),
+            "voyage_number": _text(df, "Voyage Number"),
+            "report_hours": _number(df, "Report Hours"),
+            "sfoc": _number(df, "SFOC"),
+            "scoc": _number(df, "SCOC"),
+            "failed": (reasons != "").astype(int),
+            "reason": reasons,
+            "source_file": source_file,
+            "validated_at": validated_at,
+            "data": df.to_json(orient="records", lines=True, date_format="iso").splitlines(),
+        }, index=df.index)
+        # The last occurrence of a report within one upload wins
+        reports = rows.drop_duplicates("report_key", keep="last")
+
+        exploded = validation.explode_reasons(df)
+        exploded = exploded[exploded.index.isin(reports.index)]
+        meta = rows.loc[exploded.index, ["report_key", "imo_no", "ship_name", "report_date"]]
+        failures = pd.DataFrame({
+            "report_key": meta["report_key"],
+            "rule_code": exploded["Rule Code"],
+            "reason": exploded["Reason"],
+            "imo_no": meta["imo_no"],
+            "ship_name": meta["ship_name"],
+            "report_date": meta["report_date"],
+        })
+
+        report_rows = list(reports.astype(object).itertuples(index=False, name=None))
+        key_rows = [(k,) for k in reports["report_key"]]
+        failure_rows = list(failures.astype(object).itertuples(index=False, name=None))
+
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.executemany("DELETE FROM failures WHERE report_key = ?", key_rows)
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO reports ({', '.join(reports.columns)}) "
+                    f"VALUES ({', '.join('?' * len(reports.columns))})",
+                    report_rows,
+                )
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO failures ({', '.join(failures.columns)}) "
+                    f"VALUES ({', '.join('?' * len(failures.columns))})",
+                    failure_rows,
+                )
+        return len(report_rows)
+
+    @staticmethod
+    def _filters(ship_names=None, imo_nos=None, start_date=None, end_date=None, rule_codes=None):
+        clauses, params = [], []
+        for column, values in (("ship_name", ship_names), ("imo_no", imo_nos), ("rule_code", rule_codes)):
+            if values:
+                values = [str(v) for v in ([values] if isinstance(values, str) else values)]
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if start_date is not None:
+            clauses.append("report_date >= ?")
+            params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+        if end_date is not None:
+            clauses.append("report_date <= ?")
+            params.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def failure_counts(self, group_by=("vessel", "rule"), ship_names=None, imo_nos=None,
+                       start_date=None, end_date=None, rule_codes=None):
+        """Count failures (one per report and rule) grouped by vessel/imo/rule/date/month
+
+        e.g. failure_counts(("rule",), ship_names=["Vessel X"],
+        start_date="2026-07-01", end_date="2026-09-30")
+        """
+        where, params = self._filters(ship_names, imo_nos, start_date, end_date, rule_codes)
+        groups = [GROUP_COLUMNS[g] for g in group_by]
+        labels = list(group_by)
+        select = ", ".join(f"{expr} AS {label}" for expr, label in zip(groups, labels))
+        query = (
+            f"SELECT {select + ', ' if select else ''}COUNT(DISTINCT report_key || rule_code) AS failures "
+            f"FROM failures {where}"
+        )
+        if groups:
+            query += f" GROUP BY {', '.join(labels)} ORDER BY failures DESC"
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def reports(self, ship_names=None, imo_nos=None, start_date=None, end_date=None,
+                failed_only=False, limit=None):
+        """Stored report rows (without the raw data column) matching the filters"""
+        where, params = self._filters(ship_names, imo_nos, start_date, end_date)
+        if failed_only:
+            where = f"{where} AND failed = 1" if where else "WHERE failed = 1"
+        query = (
+            "SELECT report_key, imo_no, ship_name, report_type, report_date, voyage_number, "
+            "report_hours, sfoc, scoc, failed, reason, source_file, validated_at "
+            f"FROM reports {where} ORDER BY report_date, ship_name"
+        )
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def report_data(self, report_keys):
+        """Full stored rows (all original and calculated columns) for the given keys"""
+        keys = list(report_keys)
+        if not keys:
+            return pd.DataFrame()
+        with closing(self._connect()) as conn:
+            rows = []
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows.extend(conn.execute(
+                    f"SELECT data FROM reports WHERE report_key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall())
+        return pd.read_json(io.StringIO("\n".join(r[0] for r in rows)), lines=True) if rows else pd.DataFrame()
+
+    def vessels(self):
+        """Distinct (ship_name, imo_no) pairs in the store"""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                "SELECT DISTINCT ship_name, imo_no FROM reports ORDER BY ship_name", conn
+            )
+
+    def stats(self):
+        """Total stored reports, failed reports and date coverage"""
+        with closing(self._connect()) as conn:
+            total, failed, first, last = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(failed), 0), MIN(report_date), MAX(report_date) FROM reports"
+            ).fetchone()
+        return {"reports": total, "failed": failed, "first_date": first, "last_date": last}
@@ -0,0 +1,88 @@
+"""Voyage-level KPIs from the calculated report frame (validate_reports output).
+
+Every KPI is a ratio of sums, so each report is reduced to a handful of
+additive terms (fuel, energy, cylinder oil, distance, running hours) and the
+whole fleet history is aggregated in one grouped sum. Weighted SFOC/SCOC use
+only reports where both ME load and ME running hours were given, matching
+the per-report SFOC/SCOC in validation.validate_reports.
+"""
+import numpy as np
+import pandas as pd
+
+import config
+
+
+VOYAGE_KEYS = ["Ship Name", "IMO_No", "Voyage Number"]
+ME_FUEL_COLS = [
+    "Fuel Cons. [MT] (ME Cons 1)",
+    "Fuel Cons. [MT] (ME Cons 2)",
+    "Fuel Cons. [MT] (ME Cons 3)",
+]
+DISTANCE_SEA = "Distance - Sea [NM]"
+DISTANCE_GROUND = "Distance - Ground [NM]"
+
+
+def _numeric(df, col):
+    """Column as floats with thousands separators stripped and missing values as 0"""
+    if col not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    values = df[col]
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype(str).str.replace(",", "").str.strip()
+    return pd.to_numeric(values, errors="coerce").fillna(0).astype("float64")
+
+
+def _ratio(numerator, denominator, scale=1):
+    return numerator * scale / denominator.where(denominator != 0)
+
+
+def report_terms(df):
+    """Additive per-report terms the voyage KPIs are built from"""
+    load = _numeric(df, "Average Load [kW]")
+    me_rhrs = _numeric(df, "ME Rhrs (From Last Report)")
+    me_fuel = sum(_numeric(df, col) for col in ME_FUEL_COLS)
+    # Same rows as the per-report SFOC/SCOC (load and running hours both given)
+    rated = (load != 0) & (me_rhrs != 0)
+    energy = (load * me_rhrs).where(rated, 0.0)
+    return pd.DataFrame({
+        "Reports": 1,
+        "ME Fuel [MT]": me_fuel,
+        "ME Rhrs": me_rhrs,
+        "Report Hours": _numeric(df, "Report Hours"),
+        "AE Rhrs": sum(_numeric(df, col) for col in config.AE_RHRS_COLS),
+        DISTANCE_SEA: _numeric(df, DISTANCE_SEA),
+        DISTANCE_GROUND: _numeric(df, DISTANCE_GROUND),
+        "_rated_fuel": me_fuel.where(rated, 0.0),
+        "_rated_cyl_oil": _numeric(df, "Cyl. Oil Cons. [Ltrs]").where(rated, 0.0),
+        "_energy_kwh": energy,
+    }, index=df.index)
+
+
+def voyage_kpis(df, keys=VOYAGE_KEYS):
+    """One row per voyage: fuel totals, weighted SFOC/SCOC, fuel per NM and AE-hours ratio
+
+    Empty when df has no "Voyage Number" column; vessel columns that are
+    missing are simply left out of the grouping.
+    """
+    if df is None or df.empty or "Voyage Number" not in df.columns:
+        return pd.DataFrame()
+    keys = [k for k in keys if k in df.columns]
+
+    terms = report_terms(df)
+    for key in keys:
+        terms[key] = df[key]
+    aggregations = {col: (col, "sum") for col in terms.columns if col not in keys}
+    for col, name in (("Start Date", "First Report"), ("End Date", "Last Report")):
+        if col in df.columns:
+            terms[col] = pd.to_datetime(df[col], errors="coerce")
+            aggregations[name] = (col, "min" if col == "Start Date" else "max")
+
+    totals = terms.groupby(keys, dropna=False, sort=True).agg(**aggregations)
+
+    kpis = totals.drop(columns=["_rated_fuel", "_rated_cyl_oil", "_energy_kwh"])
+    kpis["Weighted SFOC [g/kWh]"] = _ratio(totals["_rated_fuel"], totals["_energy_kwh"], 1_000_000)
+    kpis["Weighted SCOC [g/kWh]"] = _ratio(totals["_rated_cyl_oil"], totals["_energy_kwh"], 1000)
+    kpis["Fuel per NM Sea [MT/NM]"] = _ratio(totals["ME Fuel [MT]"], totals[DISTANCE_SEA])
+    kpis["Fuel per NM Ground [MT/NM]"] = _ratio(totals["ME Fuel [MT]"], totals[DISTANCE_GROUND])
+    kpis["AE Rhrs per Report Hour"] = _ratio(totals["AE Rhrs"], totals["Report Hours"])
+    return kpis.replace([np.inf, -np.inf], np.nan).reset_index()
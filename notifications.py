@@ -0,0 +1,201 @@
+"""Email notifications for validation failures.
+
+Builds the vessel alert (HTML body plus Excel attachment) and delivers it
+over SMTP. Free of Streamlit so the outbox worker and the watch-folder
+daemon can use it too.
+"""
+import io
+from datetime import datetime
+
+import pandas as pd
+
+import validation
+
+
+def build_message(sender_email, recipient_emails, subject, body, attachment_data=None,
+                  attachment_name="Failed_Validation.xlsx", cc_emails=None):
+    """Build the MIME message; returns (message, all recipients including CC)"""
+    # Deferred so cold starts that never send mail skip these imports
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.base import MIMEBase
+    from email import encoders
+    
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    
+    # Handle recipient emails
+    recipient_list = split_addresses(recipient_emails)
+    msg['To'] = ', '.join(recipient_list)
+    
+    # Handle CC emails
+    cc_list = split_addresses(cc_emails)
+    if cc_list:
+        msg['Cc'] = ', '.join(cc_list)
+    
+    msg['Subject'] = subject
+    
+    msg.attach(MIMEText(body, 'html'))
+    
+    # Attach file if provided
+    if attachment_data:
+        payload = attachment_data.getvalue() if hasattr(attachment_data, "getvalue") else attachment_data
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(payload)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename={attachment_name}')
+        msg.attach(part)
+    
+    # Combine To and CC for actual sending
+    return msg, recipient_list + cc_list
+
+
+def smtp_send(smtp_server, smtp_port, sender_email, sender_password, recipients,
+              message_string, use_tls=True):
+    """Deliver an already built message over SMTP (raises on failure)"""
+    import smtplib
+    
+    server = smtplib.SMTP(smtp_server, smtp_port, timeout=60)
+    try:
+        if use_tls:
+            server.starttls()
+        if sender_password:
+            server.login(sender_email, sender_password)
+        server.sendmail(sender_email, recipients, message_string)
+    finally:
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+
+def send_email(smtp_server, smtp_port, sender_email, sender_password, 
+               recipient_emails, subject, body, attachment_data=None, 
+               attachment_name="Failed_Validation.xlsx", cc_emails=None):
+    """Send email with optional attachment to multiple recipients"""
+    try:
+        msg, all_recipients = build_message(
+            sender_email, recipient_emails, subject, body,
+            attachment_data, attachment_name, cc_emails
+        )
+        
+        # Connect and send
+        smtp_send(smtp_server, smtp_port, sender_email, sender_password,
+                  all_recipients, msg.as_string())
+        
+        return True, "Email sent successfully!"
+    except Exception as e:
+        return False, f"Failed to send email: {str(e)}"
+
+
+def create_email_body(ship_name, failed_count, reasons_summary):
+    """Create HTML email body"""
+    body = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <h2 style="color: #2c3e50;">Vessel Report Validation Alert</h2>
+            
+            <p>Dear Captain and C/E of <strong>{ship_name}</strong>,</p>
+            
+            <p>This is an automated notification regarding recent validation failures in your vessel reports.</p>
+            
+            <div style="background-color: #fff3cd; border-left: 4px solid #ffc107; padding: 15px; margin: 20px 0;">
+                <h3 style="margin-top: 0; color: #856404;">Validation Summary</h3>
+                <p><strong>Failed Reports:</strong> {failed_count}</p>
+            </div>
+            
+            <h3>Common Issues Detected:</h3>
+            <ul>
+    {reasons_summary}
+            </ul>
+            
+            <p>Please review the attached Excel file for detailed information about the failed validations.</p>
+            
+            <h4 style="color: #2c3e50;">Action Required:</h4>
+            <ol>
+                <li>Review the attached report carefully</li>
+                <li>Correct the identified issues</li>
+                <li>Resubmit corrected reports</li>
+                <li>Contact the technical team if you need assistance</li>
+            </ol>
+            
+            <hr style="border: none; border-top: 1px solid #ddd; margin: 30px 0;">
+            
+            <p style="color: #7f8c8d; font-size: 0.9em;">
+                For any queries, please contact us at <strong><a href="mailto:smartapp@enginelink.blue">smartapp@enginelink.blue</a></strong>
+            </p>
+            
+            <p style="color: #7f8c8d; font-size: 0.85em; margin-top: 10px;">
+                This is an automated message. Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}
+            </p>
+        </body>
+    </html>
+    """
+    return body
+
+
+def split_addresses(addresses):
+    """Comma-separated string (or list) of addresses to a clean list"""
+    if not addresses:
+        return []
+    if isinstance(addresses, str):
+        return [email.strip() for email in addresses.split(',') if email.strip()]
+    return list(addresses)
+
+
+def reasons_summary_html(vessel_failed):
+    """<li> items counting each failure reason for the email body"""
+    reasons_html = ""
+    reason_counts = validation.summarize_reasons(vessel_failed)
+    for reason, count in reason_counts.items():
+        reasons_html += f"<li>{reason} ({count} occurrence{'s' if count > 1 else ''})</li>\n"
+    return reasons_html
+
+
+def failed_excel(vessel_failed, sheet_name="Failed_Validation"):
+    """Excel attachment for a vessel's failed reports"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        vessel_failed.to_excel(writer, index=False, sheet_name=sheet_name)
+    output.seek(0)
+    return output
+
+
+def vessel_notification(vessel, vessel_failed):
+    """Subject, HTML body and Excel attachment for one vessel's failures"""
+    subject = f"Vessel Report Validation Alert - {vessel}"
+    body = create_email_body(vessel, len(vessel_failed), reasons_summary_html(vessel_failed))
+    return subject, body, failed_excel(vessel_failed)
+
+
+def load_email_mapping(path):
+    """Read a vessel email mapping file ('Ship Name', 'Email' or 'To', optional CC columns)"""
+    if str(path).lower().endswith('.csv'):
+        email_df = pd.read_csv(path)
+    else:
+        email_df = pd.read_excel(path)
+    if "Ship Name" not in email_df.columns:
+        raise ValueError("Email mapping file must have 'Ship Name' column")
+    if "Email" not in email_df.columns and "To" not in email_df.columns:
+        raise ValueError("Email mapping file must have 'Email' or 'To' column")
+    return email_df
+
+
+def mapping_recipients(email_df, vessel):
+    """(to, cc list) for a vessel from the mapping, or None if it has no address"""
+    email_col = "Email" if "Email" in email_df.columns else "To"
+    cc_columns = [col for col in email_df.columns if str(col).upper().startswith('CC')]
+    
+    vessel_email_row = email_df[email_df["Ship Name"] == vessel]
+    if vessel_email_row.empty:
+        return None
+    vessel_email = vessel_email_row.iloc[0][email_col]
+    if pd.isna(vessel_email) or str(vessel_email).strip() == "":
+        return None
+    
+    cc_emails_list = []
+    for cc_col in cc_columns:
+        cc_val = vessel_email_row.iloc[0].get(cc_col)
+        if pd.notna(cc_val) and str(cc_val).strip():
+            cc_emails_list.extend(split_addresses(str(cc_val)))
+    return str(vessel_email), cc_emails_list
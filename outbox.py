@@ -0,0 +1,299 @@
+"""Durable on-disk email outbox with a background delivery worker.
+
+Fully built MIME messages (body and attachment) are spooled as .eml files in
+a queue directory, and their delivery state lives in a small SQLite database
+next to them. A DeliveryWorker thread drains the queue with retries and
+exponential backoff, so closing the browser tab or interrupting a Streamlit
+rerun no longer stops a bulk send part way, and every message has a record
+of whether it went out. A claimed message carries the claiming worker's id
+and a lease, so several workers (the app's and a standalone one) can share
+an outbox and only messages whose worker died are retried. Sent messages
+are removed from the spool.
+
+Run a worker on its own (e.g. against the local stand-in server in
+smtp_stub.py):
+    python outbox.py --smtp-server localhost --smtp-port 1025 --no-tls --sender alerts@company.com
+The SMTP password is read from the SMTP_PASSWORD environment variable.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+import notifications
+
+
+DEFAULT_OUTBOX_DIR = os.environ.get("VALIDATION_OUTBOX_DIR", "outbox")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    batch_id TEXT,
+    vessel TEXT,
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    sent_at TEXT,
+    worker_id TEXT,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_due ON messages (status, sender, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_messages_batch ON messages (batch_id);
+"""
+
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+# Comfortably longer than one SMTP send (60s socket timeout per step)
+LEASE_SECONDS = 900
+
+
+class Outbox:
+    """Spool directory of .eml files plus a SQLite status table"""
+
+    def __init__(self, directory=DEFAULT_OUTBOX_DIR):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "messages"), exist_ok=True)
+        self.db_path = os.path.join(directory, "outbox.db")
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            # Outboxes created before leases existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            for column, sql_type in (("worker_id", "TEXT"), ("lease_expires_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {sql_type}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def message_path(self, message_id):
+        return os.path.join(self.directory, "messages", f"{message_id}.eml")
+
+    def enqueue(self, message, sender, recipients, vessel=None, batch_id=None):
+        """Spool a built MIME message; returns its id
+
+        The .eml file is written (and fsynced) before the row is inserted, so
+        a queued row always has its message on disk.
+        """
+        message_id = uuid.uuid4().hex
+        path = self.message_path(message_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(message.as_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute(
+                    "INSERT INTO messages (id, batch_id, vessel, sender, recipients, subject, status, "
+                    "created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (message_id, batch_id, vessel, sender, json.dumps(list(recipients)),
+                     message["Subject"], QUEUED, datetime.now().isoformat(timespec="seconds"),
+                     time.time()),
+                )
+        return message_id
+
+    def claim_next(self, sender, worker_id=None, lease_seconds=LEASE_SECONDS):
+        """Atomically mark the next due message for this sender as sending
+
+        The claim is leased to worker_id until now + lease_seconds.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT id, recipients, attempts FROM messages "
+                    "WHERE status = ? AND sender = ? AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT 1",
+                    (QUEUED, sender, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE messages SET status = ?, worker_id = ?, lease_expires_at = ? WHERE id = ?",
+                    (SENDING, worker_id, now + lease_seconds, row[0]),
+                )
+        return {"id": row[0], "recipients": json.loads(row[1]), "attempts": row[2]}
+
+    def mark_sent(self, message_id):
+        """Record delivery and drop the message from the spool"""
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute(
+                    "UPDATE messages SET status = ?, attempts = attempts + 1, last_error = NULL, "
+                    "sent_at = ?, lease_expires_at = NULL WHERE id = ?",
+                    (SENT, datetime.now().isoformat(timespec="seconds"), message_id),
+                )
+        try:
+            os.remove(self.message_path(message_id))
+        except FileNotFoundError:
+            pass
+
+    def mark_failed_attempt(self, message_id, error, retry_at=None):
+        """Record a failed attempt; requeue at retry_at, or give up if None"""
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute(
+                    "UPDATE messages SET status = ?, attempts = attempts + 1, last_error = ?, "
+                    "next_attempt_at = COALESCE(?, next_attempt_at), lease_expires_at = NULL WHERE id = ?",
+                    (QUEUED if retry_at is not None else FAILED, str(error), retry_at, message_id),
+                )
+
+    def recover(self, sender=None):
+        """Requeue messages left in 'sending' by a worker that died mid-send
+
+        Only expired leases are requeued; a live worker's in-flight message
+        is left alone.
+        """
+        query = ("UPDATE messages SET status = ?, worker_id = NULL, lease_expires_at = NULL "
+                 "WHERE status = ? AND COALESCE(lease_expires_at, 0) < ?")
+        params = [QUEUED, SENDING, time.time()]
+        if sender:
+            query += " AND sender = ?"
+            params.append(sender)
+        with closing(self._connect()) as conn:
+            with conn:
+                return conn.execute(query, params).rowcount
+
+    def retry_failed(self, batch_id=None):
+        """Put permanently failed messages back in the queue"""
+        query = "UPDATE messages SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?"
+        params = [QUEUED, time.time(), FAILED]
+        if batch_id:
+            query += " AND batch_id = ?"
+            params.append(batch_id)
+        with closing(self._connect()) as conn:
+            with conn:
+                return conn.execute(query, params).rowcount
+
+    def read_message(self, message_id):
+        with open(self.message_path(message_id), "rb") as f:
+            return f.read()
+
+    def status_counts(self, batch_id=None, sender=None):
+        """Number of messages per status (optionally for one batch or sender)"""
+        clauses, params = [], []
+        for column, value in (("batch_id", batch_id), ("sender", sender)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        query = "SELECT status, COUNT(*) FROM messages"
+        if clauses:
+            query += f" WHERE {' AND '.join(clauses)}"
+        query += " GROUP BY status"
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute(query, params).fetchall())
+        return {status: counts.get(status, 0) for status in (QUEUED, SENDING, SENT, FAILED)}
+
+    def messages(self, batch_id=None, limit=500):
+        """Per-message delivery records, newest first"""
+        query = (
+            "SELECT vessel, recipients, subject, status, attempts, last_error, created_at, sent_at, id "
+            "FROM messages"
+        )
+        params = []
+        if batch_id:
+            query += " WHERE batch_id = ?"
+            params.append(batch_id)
+        query += f" ORDER BY created_at DESC LIMIT {int(limit)}"
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+
+class DeliveryWorker(threading.Thread):
+    """Background thread that drains the outbox for one sender account"""
+
+    def __init__(self, outbox, smtp_server, smtp_port, sender_email, sender_password,
+                 use_tls=True, max_attempts=5, base_delay=10, poll_interval=1.0):
+        super().__init__(daemon=True, name=f"outbox-{sender_email}")
+        self.outbox = outbox
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.use_tls = use_tls
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.poll_interval = poll_interval
+        self.worker_id = uuid.uuid4().hex
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def deliver_one(self):
+        """Send the next due message; returns False when nothing was due"""
+        job = self.outbox.claim_next(self.sender_email, self.worker_id)
+        if job is None:
+            return False
+        try:
+            notifications.smtp_send(
+                self.smtp_server, self.smtp_port, self.sender_email, self.sender_password,
+                job["recipients"], self.outbox.read_message(job["id"]), use_tls=self.use_tls,
+            )
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            retry_at = None
+            if attempts < self.max_attempts:
+                retry_at = time.time() + self.base_delay * 2 ** (attempts - 1)
+            self.outbox.mark_failed_attempt(job["id"], e, retry_at)
+        else:
+            self.outbox.mark_sent(job["id"])
+        return True
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                delivered = self.deliver_one()
+                if not delivered:
+                    # Messages of a worker that died mid-send come back once its lease runs out
+                    delivered = self.outbox.recover(self.sender_email) > 0
+            except Exception:
+                # Outbox DB briefly locked or similar; try again next poll
+                delivered = False
+            if not delivered:
+                self._stop_event.wait(self.poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the validation email outbox")
+    parser.add_argument("--outbox", default=DEFAULT_OUTBOX_DIR)
+    parser.add_argument("--smtp-server", default="smtp.gmail.com")
+    parser.add_argument("--smtp-port", type=int, default=587)
+    parser.add_argument("--sender", required=True, help="Sender account whose messages to deliver")
+    parser.add_argument("--no-tls", action="store_true", help="Skip STARTTLS (local test servers)")
+    parser.add_argument("--max-attempts", type=int, default=5)
+    args = parser.parse_args()
+
+    worker = DeliveryWorker(
+        Outbox(args.outbox), args.smtp_server, args.smtp_port, args.sender,
+        os.environ.get("SMTP_PASSWORD", ""), use_tls=not args.no_tls,
+        max_attempts=args.max_attempts,
+    )
+    worker.start()
+    print(f"Delivering outbox {args.outbox} for {args.sender} via {args.smtp_server}:{args.smtp_port}")
+    try:
+        while worker.is_alive():
+            worker.join(1)
+    except KeyboardInterrupt:
+        worker.stop()
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
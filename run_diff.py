@@ -0,0 +1,161 @@
+"""Run-to-run diff of validation results.
+
+Failures from two validation runs are keyed by report identity hash plus
+rule code and hash-joined (pandas merge on the key columns), so each failure
+is classified as new, resolved or persisting in a single pass regardless of
+fleet size.
+
+Usage:
+    python run_diff.py previous.xlsx current.xlsx -o Validation_Diff.xlsx
+
+Either side can be a raw dump (validated on the fly) or a saved
+Failed_Validation sheet / *_validation.xlsx result.
+"""
+import argparse
+import io
+import os
+
+import pandas as pd
+
+import validation
+
+
+NEW, RESOLVED, PERSISTING = "new", "resolved", "persisting"
+STATUS_ORDER = [NEW, PERSISTING, RESOLVED]
+CONTEXT = ["Ship Name", "IMO_No", "Report Type", "Start Date", "End Date", "Voyage Number"]
+
+
+def load_results(file_bytes, file_name):
+    """Validated rows (with Reason) from a raw dump or a saved result file"""
+    ext = os.path.splitext(str(file_name))[1].lower()
+    if ext in (".xlsx", ".xls"):
+        sheets = pd.ExcelFile(io.BytesIO(file_bytes)).sheet_names
+        if "All Reports" not in sheets:
+            sheet = "Failed_Validation" if "Failed_Validation" in sheets else sheets[0]
+            return pd.read_excel(io.BytesIO(file_bytes), sheet_name=sheet)
+    df = validation.read_reports(file_bytes, file_name)
+    if "Reason" in df.columns:
+        return df
+    _, df_with_calcs = validation.validate_reports(df)
+    return df_with_calcs
+
+
+def failure_table(results, keys=None):
+    """One row per (report, rule) failure with the rule's reasons joined"""
+    exploded = validation.explode_reasons(results)
+    columns = ["report_key", "Rule Code"] + CONTEXT + ["Reason"]
+    if exploded.empty:
+        return pd.DataFrame(columns=columns)
+    if keys is None:
+        keys = validation.report_keys(results)
+    table = results.loc[exploded.index, [c for c in CONTEXT if c in results.columns]].copy()
+    table["report_key"] = keys.loc[exploded.index].to_numpy()
+    table["Rule Code"] = exploded["Rule Code"].to_numpy()
+    table["Reason"] = exploded["Reason"].to_numpy()
+    for col in ("Start Date", "End Date"):
+        if col in table.columns:
+            table[col] = pd.to_datetime(table[col], errors="coerce")
+    # Rule 3 can fail several units on one report: one failure per rule.
+    # Only those few groups need their reasons joined; the rest pass through.
+    key = ["report_key", "Rule Code"]
+    repeated = table.duplicated(key, keep=False).to_numpy()
+    if repeated.any():
+        multi = table[repeated]
+        joined = multi.groupby(key, sort=False)["Reason"].agg("; ".join)
+        multi = multi.drop_duplicates(key).set_index(key)
+        multi["Reason"] = joined
+        table = pd.concat([table[~repeated], multi.reset_index()], ignore_index=True)
+    return table.reindex(columns=columns)
+
+
+def diff_results(previous, current):
+    """Classify every failure in either run as new, resolved or persisting
+
+    previous and current are validated frames carrying a Reason column
+    (df_with_calcs or a failed sheet). When current holds all reports,
+    "Resubmitted" tells whether a resolved failure's report is still
+    present (fixed) or absent from the new run.
+    """
+    current_keys = validation.report_keys(current)
+    before = failure_table(previous)
+    after = failure_table(current, current_keys)
+    merged = before.merge(
+        after, on=["report_key", "Rule Code"], how="outer",
+        suffixes=(" (previous)", ""), indicator=True,
+    )
+    merged["Status"] = merged["_merge"].map(
+        {"left_only": RESOLVED, "right_only": NEW, "both": PERSISTING}
+    ).astype(str)
+
+    # Context comes from the current run, falling back to the previous one
+    for col in CONTEXT:
+        merged[col] = merged[col].fillna(merged[f"{col} (previous)"])
+    merged = merged.rename(columns={"Reason": "Current Reason", "Reason (previous)": "Previous Reason"})
+
+    # Hash lookup; Series.isin on string columns builds a Python list of the values
+    merged["Resubmitted"] = pd.Index(current_keys.unique()).get_indexer(merged["report_key"]) >= 0
+
+    columns = ["Status"] + CONTEXT + ["Rule Code", "Previous Reason", "Current Reason",
+                                      "Resubmitted", "report_key"]
+    merged["Status"] = pd.Categorical(merged["Status"], categories=STATUS_ORDER, ordered=True)
+    return merged[columns].sort_values(["Status", "Ship Name", "Start Date"], kind="stable").reset_index(drop=True)
+
+
+def status_counts(diff):
+    return diff["Status"].value_counts().reindex(STATUS_ORDER, fill_value=0)
+
+
+def per_vessel_counts(diff):
+    """New / persisting / resolved failure counts per vessel"""
+    if diff.empty:
+        return pd.DataFrame(columns=STATUS_ORDER)
+    counts = pd.crosstab(diff["Ship Name"].fillna("(unknown)"), diff["Status"])
+    counts = counts.reindex(columns=STATUS_ORDER, fill_value=0)
+    return counts.sort_values(STATUS_ORDER, ascending=False)
+
+
+def per_rule_counts(diff):
+    if diff.empty:
+        return pd.DataFrame(columns=STATUS_ORDER)
+    return pd.crosstab(diff["Rule Code"], diff["Status"]).reindex(columns=STATUS_ORDER, fill_value=0)
+
+
+def diff_report(diff):
+    """Excel workbook bytes: summary, per-vessel and per-rule counts, one sheet per status"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        status_counts(diff).rename_axis("Status").reset_index(name="Failures").to_excel(
+            writer, index=False, sheet_name="Summary"
+        )
+        per_vessel_counts(diff).reset_index().to_excel(writer, index=False, sheet_name="Per_Vessel")
+        per_rule_counts(diff).reset_index().to_excel(writer, index=False, sheet_name="Per_Rule")
+        for status in STATUS_ORDER:
+            diff[diff["Status"] == status].drop(columns=["report_key"]).to_excel(
+                writer, index=False, sheet_name=status.capitalize()
+            )
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two validation runs")
+    parser.add_argument("previous")
+    parser.add_argument("current")
+    parser.add_argument("-o", "--output", default="Validation_Diff.xlsx")
+    args = parser.parse_args()
+
+    runs = []
+    for path in (args.previous, args.current):
+        with open(path, "rb") as f:
+            runs.append(load_results(f.read(), path))
+    diff = diff_results(*runs)
+    with open(args.output, "wb") as f:
+        f.write(diff_report(diff))
+
+    print(status_counts(diff).to_string())
+    print()
+    print(per_vessel_counts(diff).to_string())
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""Standalone HTTP validation service.
+
+Runs report validation without Streamlit so other systems (noon-report
+ingestion, dashboards) can post a dump and get the failed rows back.
+
+Usage:
+    python service.py --host 127.0.0.1 --port 8502 --workers 4 --queue 16 [--prewarm] \\
+        [--max-body-mb 200]
+
+Endpoints:
+    POST /validate?filename=dump.xlsx[&format=json|arrow][&dedup=0]
+        Body is the raw workbook/CSV/Parquet file. Returns failed rows and
+        a reason summary as JSON, or the failed rows as an Arrow IPC stream
+        (reason summary stored in the schema metadata). Duplicate reports
+        are dropped before validation unless dedup=0. Bodies over the size
+        limit get 413; a request whose worker crashed gets 503 and the
+        pool is restarted.
+    GET /metrics
+        Request counts, queue depth and latency percentiles.
+    GET /health
+        Liveness check.
+"""
+import argparse
+import io
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import dedup
+import startup
+import validation
+
+
+CONTENT_TYPE_EXTENSIONS = {
+    "text/csv": ".csv",
+    "application/vnd.apache.parquet": ".parquet",
+    "application/x-parquet": ".parquet",
+    "application/vnd.ms-excel": ".xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+}
+MAX_BODY_BYTES = 200 * 1024 * 1024
+
+
+def run_validation(file_bytes, file_name, remove_duplicates=True):
+    """Worker entry point: parse and validate one payload"""
+    started = time.perf_counter()
+    df = validation.read_reports(file_bytes, file_name)
+    duplicates = None
+    if remove_duplicates:
+        df, duplicates = dedup.deduplicate(df)
+    failed, _ = validation.validate_reports(df)
+    return {
+        "total_rows": len(df),
+        "duplicates_removed": dedup.duplicate_summary(duplicates).to_dict(),
+        "failed": failed,
+        "reason_summary": validation.summarize_reasons(failed).to_dict(),
+        "validate_seconds": time.perf_counter() - started,
+    }
+
+
+class ServiceMetrics:
+    """Thread-safe request counters and a rolling latency window"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._waits = deque(maxlen=window)
+        self.started_at = time.time()
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.errors = 0
+        self.pool_restarts = 0
+        self.in_flight = 0
+
+    def accept(self):
+        with self._lock:
+            self.accepted += 1
+            self.in_flight += 1
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def pool_restarted(self):
+        with self._lock:
+            self.pool_restarts += 1
+
+    def finish(self, latency, wait, ok=True):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+                self._latencies.append(latency)
+                self._waits.append(wait)
+            else:
+                self.errors += 1
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {"p50": None, "p95": None, "p99": None, "max": None}
+        ordered = sorted(values)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+        return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 4)}
+
+    def snapshot(self, workers, queue_limit):
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "workers": workers,
+                "queue_limit": queue_limit,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - workers),
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "errors": self.errors,
+                "pool_restarts": self.pool_restarts,
+                "latency_seconds": self._percentiles(self._latencies),
+                "queue_wait_seconds": self._percentiles(self._waits),
+                "startup_seconds": startup.timings(),
+            }
+
+
+class ValidationService:
+    """Bounded process pool with an admission limit in front of it"""
+
+    def __init__(self, workers=2, queue_limit=8, prewarm=False):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.prewarm = prewarm
+        self._pool_lock = threading.Lock()
+        self.executor = self._new_pool()
+        if prewarm:
+            # Start every worker now rather than on the first request
+            for future in [self.executor.submit(time.sleep, 0) for _ in range(workers)]:
+                future.result()
+            # prewarm marks its timing inside the worker; record it here for /metrics
+            startup.mark("prewarm_done")
+        # Running jobs plus waiting jobs; anything beyond this is rejected
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.metrics = ServiceMetrics()
+
+    def _new_pool(self):
+        # Pre-warmed workers have already imported and run the parse/validate path
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=startup.prewarm if self.prewarm else None,
+        )
+
+    def _replace_pool(self, broken):
+        """Swap in a fresh pool after a worker died (once, however many requests saw it)"""
+        with self._pool_lock:
+            if self.executor is broken:
+                self.executor = self._new_pool()
+                self.metrics.pool_restarted()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, file_bytes, file_name, remove_duplicates=True):
+        """Run validation in the pool; returns None if the queue is full
+
+        Raises BrokenProcessPool if a worker died during the request; the
+        pool has been replaced by then, so the request can be retried.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.metrics.reject()
+            return None
+        self.metrics.accept()
+        submitted = time.perf_counter()
+        ok = False
+        result = None
+        executor = self.executor
+        try:
+            try:
+                result = executor.submit(
+                    run_validation, file_bytes, file_name, remove_duplicates
+                ).result()
+            except BrokenProcessPool:
+                self._replace_pool(executor)
+                raise
+            ok = True
+            startup.mark("first_result")
+            return result
+        finally:
+            latency = time.perf_counter() - submitted
+            wait = latency - result["validate_seconds"] if ok else 0
+            self.metrics.finish(latency, wait, ok)
+            self._slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def failed_to_arrow(failed, summary):
+    """Serialize failed rows as an Arrow IPC stream"""
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(failed, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (e.g. times stored as text and time objects)
+        failed = failed.copy()
+        for col in failed.select_dtypes(include="object").columns:
+            failed[col] = failed[col].astype(str)
+        table = pa.Table.from_pandas(failed, preserve_index=False)
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"reason_summary"] = json.dumps(summary).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def make_handler(service, max_body_bytes=MAX_BODY_BYTES):
+    """Build a request handler bound to a ValidationService"""
+
+    class ValidationHandler(BaseHTTPRequestHandler):
+        server_version = "VesselReportValidator/1.0"
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, payload, headers=None):
+            self._send(status, json.dumps(payload, default=str).encode("utf-8"), headers=headers)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif path == "/metrics":
+                self._send_json(200, service.metrics.snapshot(service.workers, service.queue_limit))
+            else:
+                self._send_json(404, {"error": f"Unknown path {path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/validate":
+                self._send_json(404, {"error": f"Unknown path {url.path}"})
+                return
+
+            params = parse_qs(url.query)
+            output_format = params.get("format", ["json"])[0].lower()
+            if output_format not in ("json", "arrow"):
+                self._send_json(400, {"error": "format must be 'json' or 'arrow'"})
+                return
+
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+            file_name = params.get(
+                "filename",
+                ["upload" + CONTENT_TYPE_EXTENSIONS.get(content_type, ".xlsx")],
+            )[0]
+
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                self._send_json(400, {"error": "Invalid Content-Length header"})
+                return
+            if length <= 0:
+                self._send_json(400, {"error": "Request body is empty"})
+                return
+            if length > max_body_bytes:
+                self._send_json(413, {"error": f"Request body is larger than {max_body_bytes} bytes"})
+                return
+            file_bytes = self.rfile.read(length)
+            remove_duplicates = params.get("dedup", ["1"])[0].lower() not in ("0", "false", "no")
+
+            try:
+                result = service.submit(file_bytes, file_name, remove_duplicates)
+            except BrokenProcessPool:
+                self._send_json(503, {"error": "Validation worker crashed; the pool was restarted, retry"},
+                                headers={"Retry-After": "5"})
+                return
+            except Exception as e:
+                self._send_json(422, {"error": f"Error processing file: {str(e)}"})
+                return
+
+            if result is None:
+                self._send_json(503, {"error": "Validation queue is full, retry later"},
+                                headers={"Retry-After": "5"})
+                return
+
+            failed = result["failed"]
+            summary = result["reason_summary"]
+
+            if output_format == "arrow":
+                try:
+                    body = failed_to_arrow(failed, summary)
+                except ImportError:
+                    self._send_json(501, {"error": "Arrow output requires pyarrow"})
+                    return
+                self._send(200, body, content_type="application/vnd.apache.arrow.stream",
+                           headers={"X-Total-Rows": str(result["total_rows"]),
+                                    "X-Failed-Rows": str(len(failed))})
+                return
+
+            self._send_json(200, {
+                "file_name": file_name,
+                "total_rows": result["total_rows"],
+                "failed_count": len(failed),
+                "duplicates_removed": result["duplicates_removed"],
+                "reason_summary": summary,
+                "failed": json.loads(failed.to_json(orient="records", date_format="iso")),
+                "validate_seconds": round(result["validate_seconds"], 4),
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return ValidationHandler
+
+
+def serve(host="127.0.0.1", port=8502, workers=2, queue_limit=8, prewarm=startup.PREWARM_ENABLED,
+          max_body_bytes=MAX_BODY_BYTES):
+    """Start the HTTP service and block until interrupted"""
+    service = ValidationService(workers=workers, queue_limit=queue_limit, prewarm=prewarm)
+    startup.mark("ready")
+    httpd = ThreadingHTTPServer((host, port), make_handler(service, max_body_bytes))
+    print(f"Validation service listening on http://{host}:{port} "
+          f"({workers} workers, queue limit {queue_limit})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ship report validation HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent validation workers")
+    parser.add_argument("--queue", type=int, default=8, help="Requests allowed to wait for a worker")
+    parser.add_argument("--prewarm", action="store_true", default=startup.PREWARM_ENABLED,
+                        help="Run a sample dump through each worker at boot (or set VALIDATOR_PREWARM=1)")
+    parser.add_argument("--max-body-mb", type=float, default=MAX_BODY_BYTES / (1024 * 1024),
+                        help="Largest accepted upload in MB (bigger requests get 413)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.queue, args.prewarm,
+          int(args.max_body_mb * 1024 * 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Local stand-in SMTP server for exercising the email outbox.
+
+Accepts mail without TLS or authentication and writes each message to a
+directory as an .eml file instead of delivering it.
+
+Usage:
+    python smtp_stub.py --port 1025 --maildir sent_mail [--fail-first 2]
+
+--fail-first N rejects the first N messages with a temporary error so the
+worker's retry path can be tried out.
+"""
+import argparse
+import os
+import socketserver
+import threading
+import uuid
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Just enough of RFC 5321 for smtplib.sendmail"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        self.reply("220 smtp-stub ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 smtp-stub")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                if server.should_fail():
+                    self.reply("451 Temporary failure (smtp-stub)")
+                    continue
+                server.store(sender, recipients, b"".join(lines))
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPStubServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, maildir, fail_first=0):
+        super().__init__(address, SMTPStubHandler)
+        self.maildir = maildir
+        self.fail_remaining = fail_first
+        self.received = []
+        self._lock = threading.Lock()
+        os.makedirs(maildir, exist_ok=True)
+
+    def should_fail(self):
+        with self._lock:
+            if self.fail_remaining > 0:
+                self.fail_remaining -= 1
+                return True
+            return False
+
+    def store(self, sender, recipients, data):
+        path = os.path.join(self.maildir, f"{uuid.uuid4().hex}.eml")
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self.received.append({"sender": sender, "recipients": recipients, "path": path})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in SMTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--maildir", default="sent_mail")
+    parser.add_argument("--fail-first", type=int, default=0)
+    args = parser.parse_args()
+
+    server = SMTPStubServer((args.host, args.port), args.maildir, args.fail_first)
+    print(f"SMTP stub listening on {args.host}:{args.port}, writing to {args.maildir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
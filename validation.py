@@ -0,0 +1,327 @@
+"""Core report validation logic shared by the Streamlit app and the HTTP service.
+
+Nothing in this module imports Streamlit, so it can be used from worker
+processes and command line tools.
+"""
+import io
+import os
+
+import pandas as pd
+import numpy as np
+from datetime import datetime
+
+import config
+import exhaust
+from config import REPORT_IDENTITY_COLS, RULE_CODES
+
+
+def read_reports(file_bytes, file_name, sheet_name="All Reports"):
+    """Load a report dump from Excel, CSV or Parquet bytes into a DataFrame"""
+    ext = os.path.splitext(str(file_name))[1].lower()
+    buffer = io.BytesIO(file_bytes)
+    if ext == ".csv":
+        return pd.read_csv(buffer)
+    if ext in (".parquet", ".pq"):
+        return pd.read_parquet(buffer)
+    return pd.read_excel(buffer, sheet_name=sheet_name)
+
+
+def calculate_report_hours_from_data(start_dates, end_dates, start_times, end_times, time_shifts):
+    """Calculate Report Hours from Start Date/Time, End Date/Time and Time Shift"""
+    report_hours = []
+    
+    for idx in range(len(start_dates)):
+        try:
+            # Get date and time components
+            start_date = pd.to_datetime(start_dates[idx], errors='coerce')
+            end_date = pd.to_datetime(end_dates[idx], errors='coerce')
+            
+            # Get time components (handle various formats)
+            start_time = str(start_times[idx] if idx < len(start_times) else "00:00:00").strip()
+            end_time = str(end_times[idx] if idx < len(end_times) else "00:00:00").strip()
+            
+            # Handle time shift (convert to hours)
+            time_shift = time_shifts[idx] if idx < len(time_shifts) else 0
+            if pd.isna(time_shift):
+                time_shift = 0
+            else:
+                time_shift = float(time_shift)
+            
+            # Create datetime objects
+            if pd.notna(start_date) and pd.notna(end_date):
+                # Parse time strings
+                try:
+                    start_time_obj = pd.to_datetime(start_time, format='%H:%M:%S').time()
+                except:
+                    try:
+                        start_time_obj = pd.to_datetime(start_time, format='%H:%M').time()
+                    except:
+                        start_time_obj = datetime.strptime("00:00:00", '%H:%M:%S').time()
+                
+                try:
+                    end_time_obj = pd.to_datetime(end_time, format='%H:%M:%S').time()
+                except:
+                    try:
+                        end_time_obj = pd.to_datetime(end_time, format='%H:%M').time()
+                    except:
+                        end_time_obj = datetime.strptime("00:00:00", '%H:%M:%S').time()
+                
+                # Combine date and time
+                start_datetime = datetime.combine(start_date.date(), start_time_obj)
+                end_datetime = datetime.combine(end_date.date(), end_time_obj)
+                
+                # Calculate time difference
+                time_diff = end_datetime - start_datetime
+                hours_diff = time_diff.total_seconds() / 3600
+                
+                # Add time shift
+                total_hours = hours_diff + time_shift
+                
+                report_hours.append(round(total_hours, 2))
+            else:
+                report_hours.append(0)
+                
+        except Exception as e:
+            report_hours.append(0)
+    
+    return report_hours
+
+def calculate_report_hours(df):
+    """Calculate Report Hours from Start Date/Time, End Date/Time and Time Shift"""
+    df = df.copy()
+    start_dates = df.get("Start Date", pd.Series([None]*len(df))).tolist()
+    end_dates = df.get("End Date", pd.Series([None]*len(df))).tolist()
+    start_times = df.get("Start Time", pd.Series(["00:00:00"]*len(df))).tolist()
+    end_times = df.get("End Time", pd.Series(["00:00:00"]*len(df))).tolist()
+    time_shifts = df.get("Time Shift", pd.Series([0]*len(df))).tolist()
+    
+    return calculate_report_hours_from_data(
+        tuple(start_dates), 
+        tuple(end_dates), 
+        tuple(start_times), 
+        tuple(end_times), 
+        tuple(time_shifts)
+    )
+
+def validate_reports(df):
+    """Validate ship reports and return failed rows with reasons"""
+    df = df.copy()
+    
+    # --- Clean numeric columns ---
+    for col in config.NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = (
+                df[col]
+                .astype(str)
+                .str.replace(",", "")
+                .str.strip()
+                .replace(["", "nan", "None"], np.nan)
+            )
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+
+    # --- Calculate Report Hours ---
+    df["Report Hours"] = calculate_report_hours(df)
+
+    # --- Calculate SFOC in g/kWh ---
+    df["SFOC"] = (
+        (
+            df["Fuel Cons. [MT] (ME Cons 1)"]
+            + df["Fuel Cons. [MT] (ME Cons 2)"]
+            + df["Fuel Cons. [MT] (ME Cons 3)"]
+        )
+        * 1_000_000
+        / (df["Average Load [kW]"].replace(0, np.nan)
+           * df["ME Rhrs (From Last Report)"].replace(0, np.nan))
+    )
+    df["SFOC"] = df["SFOC"].fillna(0)
+
+    # --- Calculate SCOC in g/kWh ---
+    df["SCOC"] = (
+        df["Cyl. Oil Cons. [Ltrs]"] * 1000
+        / (df["Average Load [kW]"].replace(0, np.nan)
+           * df["ME Rhrs (From Last Report)"].replace(0, np.nan))
+    )
+    df["SCOC"] = df["SCOC"].fillna(0)
+
+    # --- Rule 3 runs over the whole exhaust matrix at once ---
+    report_types = (
+        df["Report Type"].astype(str).str.strip()
+        if "Report Type" in df.columns
+        else pd.Series("", index=df.index)
+    )
+    at_sea_long = (report_types == "At Sea").to_numpy() & (df["ME Rhrs (From Last Report)"] > 12).to_numpy()
+    exhaust_units, exhaust_cols, exhaust_temps = exhaust.exhaust_matrix(df)
+    exhaust_fails = exhaust.deviation_failures(exhaust_temps, rows=at_sea_long)
+    exhaust_fail_rows = exhaust_fails.any(axis=1)
+
+    reasons = []
+    fail_columns = set()
+
+    for pos, (idx, row) in enumerate(df.iterrows()):
+        reason = []
+        report_type = str(row.get("Report Type", "")).strip()
+        ME_Rhrs = row.get("ME Rhrs (From Last Report)", 0)
+        report_hours = row.get("Report Hours", 0)
+        sfoc = row.get("SFOC", 0)
+        scoc = row.get("SCOC", 0)
+        avg_speed = row.get("Avg. Speed", 0)
+
+        # --- Rule 1: SFOC (only for At Sea) ---
+        if report_type == "At Sea" and ME_Rhrs > 12:
+            if not (150 <= sfoc <= 200):
+                reason.append("SFOC out of 150-200 at sea with ME Rhrs > 12")
+                fail_columns.add("SFOC")
+
+        # --- Rule 2: Avg Speed (only for At Sea) ---
+        if report_type == "At Sea" and ME_Rhrs > 12:
+            if not (0 <= avg_speed <= 20):
+                reason.append("Avg. Speed out of 0-20 at sea with ME Rhrs > 12")
+                fail_columns.add("Avg. Speed")
+
+        # --- Rule 3: Exhaust Temp deviation (Units 1-16, only At Sea) ---
+        if exhaust_fail_rows[pos]:
+            for k, (j, c) in enumerate(zip(exhaust_units, exhaust_cols)):
+                if exhaust_fails[pos, k]:
+                    reason.append(f"Exhaust temp deviation > ±50 from avg at Unit {j}")
+                    fail_columns.add(c)
+
+        # --- Rule 4: ME Rhrs should not exceed Report Hours (with ±1 hour margin) ---
+        if report_hours > 0:
+            hours_diff = ME_Rhrs - report_hours
+            if hours_diff > 1.0:
+                reason.append(f"ME Rhrs ({ME_Rhrs:.2f}) exceeds Report Hours ({report_hours:.2f}) by {hours_diff:.2f}h (margin: ±1h)")
+                fail_columns.add("ME Rhrs (From Last Report)")
+                fail_columns.add("Report Hours")
+
+        # --- Rule 5: Multiple Aux Engines operating at sea without sub-consumers ---
+        if report_type == "At Sea" and row.get("Average Load [%]", 0) > 40:
+            # Sum all auxiliary engine running hours
+            ae_rhrs_sum = sum(row.get(c, 0) for c in config.AE_RHRS_COLS)
+            
+            # Calculate AE running hours ratio
+            if report_hours > 0:
+                ae_ratio = ae_rhrs_sum / report_hours
+            else:
+                ae_ratio = 0
+            
+            # Sum all sub-consumers
+            sub_consumers_sum = sum(row.get(c, 0) for c in config.SUB_CONSUMER_COLS)
+            
+            # Check if 2+ Aux Engines operating (ratio > 1.25) with ME Load > 40% and no sub-consumers
+            if ae_ratio > 1.25 and sub_consumers_sum == 0:
+                reason.append(f"Multiple Aux Engines operating at sea (AE Rhrs/Report Hours = {ae_ratio:.2f}) with ME Load > 40% but no sub-consumers reported. Please confirm operations and update sub-consumption fields if applicable")
+                fail_columns.add("Average Load [%]")
+                fail_columns.add("A.E. 1 Last Report [Rhrs] (Aux Engine Unit 1)")
+                fail_columns.add("A.E. 2 Last Report [Rhrs] (Aux Engine Unit 2)")
+                fail_columns.add("A.E. 3 Last Report [Rhrs] (Aux Engine Unit 3)")
+                fail_columns.add("Tank Cleaning [MT]")
+                fail_columns.add("Cargo Transfer [MT]")
+
+        # --- Rule 6: SCOC (Specific Cylinder Oil Consumption) - only for At Sea ---
+        if report_type == "At Sea" and ME_Rhrs > 12:
+            if scoc > 0:  # Only validate if SCOC was calculated (i.e., not zero/missing data)
+                if scoc < 0.8:
+                    reason.append(f"SCOC ({scoc:.2f} g/kWh) is lower than normal range (0.8-1.5 g/kWh)")
+                    fail_columns.add("SCOC")
+                    fail_columns.add("Cyl. Oil Cons. [Ltrs]")
+                elif scoc > 1.5:
+                    reason.append(f"SCOC ({scoc:.2f} g/kWh) is higher than normal range (0.8-1.5 g/kWh)")
+                    fail_columns.add("SCOC")
+                    fail_columns.add("Cyl. Oil Cons. [Ltrs]")
+
+        reasons.append("; ".join(reason))
+
+    df["Reason"] = reasons
+    failed = df[df["Reason"] != ""].copy()
+
+    # --- Always include Ship Name and Exhaust Temp columns ---
+    # Combine all columns and remove duplicates while preserving order
+    cols_to_keep = config.CONTEXT_COLS + exhaust_cols + list(fail_columns) + ["Reason"]
+    
+    # Remove duplicates while preserving order
+    seen = set()
+    cols_to_keep_unique = []
+    for col in cols_to_keep:
+        if col not in seen and col in failed.columns:
+            seen.add(col)
+            cols_to_keep_unique.append(col)
+    
+    # Move Ship Name to Column A
+    if "Ship Name" in cols_to_keep_unique:
+        cols_to_keep_unique.remove("Ship Name")
+        cols_to_keep_unique = ["Ship Name"] + cols_to_keep_unique
+
+    failed = failed[cols_to_keep_unique]
+
+    return failed, df
+
+
+def summarize_reasons(failed):
+    """Count each individual failure reason across the failed rows"""
+    if failed is None or failed.empty or "Reason" not in failed.columns:
+        return pd.Series(dtype="int64")
+    reasons = failed["Reason"].fillna("").astype(str).str.split("; ").explode()
+    reasons = reasons[reasons != ""]
+    return reasons.value_counts()
+
+
+# --- Report identity and rule codes (used by history, diff and dedup) ---
+def explode_reasons(df):
+    """One row per (report, reason) with the rule code attached"""
+    if df is None or df.empty or "Reason" not in df.columns:
+        return pd.DataFrame(columns=["Reason", "Rule Code"])
+    reasons = df["Reason"].fillna("").astype(str).str.split("; ").explode()
+    reasons = reasons[reasons != ""]
+    # Rule code from the reason's prefix (first match in RULE_CODES wins, else OTHER)
+    codes = np.select(
+        [reasons.str.startswith(prefix).to_numpy(dtype=bool) for prefix, _ in RULE_CODES],
+        [code for _, code in RULE_CODES],
+        default="OTHER",
+    )
+    return pd.DataFrame({"Reason": reasons, "Rule Code": codes}, index=reasons.index)
+
+
+def _identity_part(df, col):
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    values = df[col]
+    if "Date" in col:
+        return pd.to_datetime(values, errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
+    values = values.astype(str).str.strip().replace(["nan", "None", "NaT"], "").fillna("")
+    if "Time" in col:
+        # 12:00 and 12:00:00 are the same report time
+        return values.str.replace(r"^(\d{1,2}:\d{2})$", r"\1:00", regex=True)
+    # IMO numbers read back as floats when the column has gaps
+    return values.str.replace(r"\.0$", "", regex=True)
+
+
+def imo_numbers(df):
+    """Normalized IMO number per row ("" when missing)"""
+    return _identity_part(df, "IMO_No")
+
+
+def _vessel_part(df):
+    # Without an IMO the ship name identifies the vessel, so reports from
+    # different ships on the same dates never share a key
+    imo = imo_numbers(df)
+    ship = _identity_part(df, "Ship Name")
+    return imo.where((imo != "") | (ship == ""), "name:" + ship)
+
+
+def report_identity(df):
+    """Normalized identity columns used to recognise the same report across uploads
+
+    IMO_No falls back to the ship name when it is missing; it is "" only
+    when the row names no vessel at all.
+    """
+    return pd.DataFrame(
+        {col: _vessel_part(df) if col == "IMO_No" else _identity_part(df, col)
+         for col in REPORT_IDENTITY_COLS},
+        index=df.index,
+    )
+
+
+def report_keys(df):
+    """Hex hash of each row's report identity"""
+    hashes = pd.util.hash_pandas_object(report_identity(df), index=False)
+    return hashes.map("{:016x}".format)
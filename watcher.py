@@ -0,0 +1,328 @@
+"""Watch-folder daemon that validates report dumps as they land.
+
+Polls a directory for new or changed workbooks/CSV/Parquet files (by size,
+mtime and content hash), waits until a file has stopped growing, and
+validates it on a bounded process pool. If a worker dies (e.g. out of
+memory on a huge workbook) the pool is restarted and the files that were in
+flight are retried one at a time; a file that kills a worker on its own is
+recorded as an error and left until it changes. Results are written next to
+the input as <name>_validation.xlsx (failed rows, reason summary, voyage KPIs
+and any duplicate reports dropped before validation) and
+<name>_validation.json. Failures can optionally be queued to the email
+outbox and saved to the history database.
+
+Usage:
+    python watcher.py /shared/dumps --workers 2 --interval 15 \\
+        [--history] [--notify-mapping vessel_emails.xlsx --sender alerts@company.com \\
+         --smtp-server smtp.office365.com --smtp-port 587]
+
+The SMTP password is read from the SMTP_PASSWORD environment variable.
+Without --smtp-server, notifications are only queued to the outbox for a
+separately running `python outbox.py` worker.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import pandas as pd
+
+import dedup
+import kpi
+import validation
+
+
+WATCHED_EXTENSIONS = (".xlsx", ".xls", ".csv", ".parquet", ".pq")
+RESULT_SUFFIX = "_validation"
+STATE_FILE = ".validator_state.json"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def result_paths(path):
+    stem = os.path.splitext(path)[0]
+    return f"{stem}{RESULT_SUFFIX}.xlsx", f"{stem}{RESULT_SUFFIX}.json"
+
+
+def validate_file(path):
+    """Worker entry point: validate one file and write results next to it"""
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    df = validation.read_reports(file_bytes, path)
+    df, duplicates = dedup.deduplicate(df)
+    failed, df_with_calcs = validation.validate_reports(df)
+    summary = validation.summarize_reasons(failed)
+
+    xlsx_path, json_path = result_paths(path)
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        failed.to_excel(writer, index=False, sheet_name="Failed_Validation")
+        summary.rename_axis("Reason").reset_index(name="Count").to_excel(
+            writer, index=False, sheet_name="Reason_Summary"
+        )
+        voyages = kpi.voyage_kpis(df_with_calcs)
+        if not voyages.empty:
+            voyages.to_excel(writer, index=False, sheet_name="Voyage_KPIs")
+        if not duplicates.empty:
+            duplicates.to_excel(writer, index=False, sheet_name="Duplicates")
+    # Write to a temp name first so readers never see a half-written file
+    for target, data in (
+        (xlsx_path, buffer.getvalue()),
+        (json_path, json.dumps({
+            "source": os.path.basename(path),
+            "validated_at": datetime.now().isoformat(timespec="seconds"),
+            "total_rows": len(df),
+            "failed_rows": len(failed),
+            "duplicates_removed": dedup.duplicate_summary(duplicates).to_dict(),
+            "reason_summary": summary.to_dict(),
+            "seconds": round(time.perf_counter() - started, 3),
+        }, indent=2).encode("utf-8")),
+    ):
+        with open(f"{target}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{target}.tmp", target)
+
+    return {"path": path, "failed": failed, "df_with_calcs": df_with_calcs,
+            "total_rows": len(df), "seconds": time.perf_counter() - started}
+
+
+class FolderWatcher:
+    """Polls a directory and feeds changed files to a bounded process pool"""
+
+    def __init__(self, directory, workers=2, max_pending=None, interval=15,
+                 on_result=None, log=print):
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.interval = interval
+        self.on_result = on_result
+        self.log = log
+        self.state_path = os.path.join(directory, STATE_FILE)
+        self.processed = self._load_state()
+        # path -> (size, mtime) seen on the previous scan, to detect files still being written
+        self.last_seen = {}
+        self.pending = {}
+        # Files in flight when a worker died; each is retried on its own to find the culprit
+        self.suspects = set()
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.processed, f, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def submit(self, path):
+        """Submit a file, replacing the pool first if a worker died and broke it"""
+        try:
+            return self.executor.submit(validate_file, path)
+        except BrokenProcessPool:
+            self.log("Worker pool broken (a worker died), restarting it")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor.submit(validate_file, path)
+
+    def candidates(self):
+        """Input files in the directory (our own result files excluded)"""
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            if not entry.is_file() or name.startswith((".", "~$")):
+                continue
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in WATCHED_EXTENSIONS and not stem.endswith(RESULT_SUFFIX):
+                yield entry
+
+    def scan(self):
+        """Queue files that are new or changed and have stopped growing"""
+        seen = {}
+        for entry in self.candidates():
+            path = entry.path
+            try:
+                stat = entry.stat()
+            except OSError:
+                # Moved or deleted since the directory listing; seen again next scan if it returns
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            seen[path] = signature
+
+            if path in self.pending:
+                continue
+            known = self.processed.get(path)
+            if known and (known["size"], known["mtime"]) == signature:
+                continue
+            # Only pick up a file once size and mtime are unchanged across two scans
+            if self.last_seen.get(path) != signature:
+                continue
+            if len(self.pending) >= self.max_pending:
+                # Picked up on a later scan once a slot frees
+                continue
+            if self.suspects.intersection(self.pending) or (path in self.suspects and self.pending):
+                # A suspect runs alone, so a crash can be pinned on it
+                continue
+
+            try:
+                digest = file_hash(path)
+            except OSError as e:
+                self.log(f"Skipping {os.path.basename(path)} this scan: {e}")
+                continue
+            if known and known["sha256"] == digest:
+                # Touched but not changed
+                self.processed[path] = dict(known, size=stat.st_size, mtime=stat.st_mtime)
+                self._save_state()
+                continue
+
+            future = self.submit(path)
+            self.pending[path] = (future, {"size": stat.st_size, "mtime": stat.st_mtime,
+                                           "sha256": digest, "queued_at": time.time()})
+            self.log(f"Queued {os.path.basename(path)}")
+        self.last_seen = seen
+
+    def collect(self):
+        """Handle finished validations"""
+        for path, (future, meta) in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[path]
+            name = os.path.basename(path)
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                # Every file in flight fails when one worker dies (e.g. out of memory).
+                # They are retried one at a time on later scans, which also restart the pool.
+                if path not in self.suspects:
+                    self.suspects.add(path)
+                    self.log(f"Worker died while validating {name}, retrying it on its own")
+                    continue
+                self.suspects.discard(path)
+                self.log(f"Worker died validating {name} on its own, not retrying until it changes")
+                self.processed[path] = dict(meta, error="worker process died")
+                self._save_state()
+                continue
+            except Exception as e:
+                self.suspects.discard(path)
+                self.log(f"Error validating {name}: {e}")
+                # Recorded so a broken file is not retried until it changes
+                self.processed[path] = dict(meta, error=str(e))
+                self._save_state()
+                continue
+
+            self.suspects.discard(path)
+            latency = time.time() - meta["queued_at"]
+            self.log(f"Validated {name}: {len(result['failed'])}/{result['total_rows']} failed "
+                     f"({result['seconds']:.1f}s validate, {latency:.1f}s from queue)")
+            self.processed[path] = dict(meta, failed_rows=len(result["failed"]),
+                                        validated_at=datetime.now().isoformat(timespec="seconds"))
+            self._save_state()
+            if self.on_result:
+                try:
+                    self.on_result(result)
+                except Exception as e:
+                    self.log(f"Error handling results for {name}: {e}")
+
+    def run_forever(self):
+        self.log(f"Watching {self.directory} every {self.interval}s with {self.workers} workers")
+        try:
+            while True:
+                self.collect()
+                self.scan()
+                time.sleep(self.interval if not self.pending else min(self.interval, 1))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=True)
+            self.collect()
+
+
+def notifier(mapping_path, sender_email, outbox_dir=None, log=print):
+    """Build an on_result callback that queues vessel alerts to the outbox"""
+    import notifications
+    import outbox
+
+    store = outbox.Outbox(outbox_dir or outbox.DEFAULT_OUTBOX_DIR)
+    email_df = notifications.load_email_mapping(mapping_path)
+
+    def notify(result):
+        failed = result["failed"]
+        if failed.empty or "Ship Name" not in failed.columns:
+            return
+        batch_id = f"{os.path.basename(result['path'])}-{datetime.now():%Y%m%d-%H%M%S}"
+        for vessel in failed["Ship Name"].unique():
+            recipients = notifications.mapping_recipients(email_df, vessel)
+            if recipients is None:
+                log(f"No email mapping for {vessel}, not notified")
+                continue
+            to, cc = recipients
+            vessel_failed = failed[failed["Ship Name"] == vessel]
+            subject, body, attachment = notifications.vessel_notification(vessel, vessel_failed)
+            message, all_recipients = notifications.build_message(
+                sender_email, to, subject, body, attachment,
+                f"Failed_Validation_{vessel}.xlsx", cc_emails=cc or None,
+            )
+            store.enqueue(message, sender_email, all_recipients, vessel=vessel, batch_id=batch_id)
+        log(f"Queued notifications for batch {batch_id}")
+
+    return store, notify
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate report dumps as they land in a folder")
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Files queued or running at once (default 2 x workers)")
+    parser.add_argument("--interval", type=float, default=15, help="Seconds between scans")
+    parser.add_argument("--history", action="store_true", help="Save results to the history database")
+    parser.add_argument("--notify-mapping", help="Vessel email mapping (Excel/CSV) to queue alerts")
+    parser.add_argument("--sender", help="Sender address for alerts")
+    parser.add_argument("--outbox", default=None)
+    parser.add_argument("--smtp-server", help="Also run a delivery worker against this server")
+    parser.add_argument("--smtp-port", type=int, default=587)
+    parser.add_argument("--no-tls", action="store_true")
+    args = parser.parse_args()
+
+    handlers = []
+    if args.history:
+        import history
+        store = history.HistoryStore()
+        handlers.append(lambda result: store.upsert(result["df_with_calcs"], source_file=result["path"]))
+    if args.notify_mapping:
+        if not args.sender:
+            parser.error("--notify-mapping requires --sender")
+        mail_store, notify = notifier(args.notify_mapping, args.sender, args.outbox)
+        handlers.append(notify)
+        if args.smtp_server:
+            import outbox
+            outbox.DeliveryWorker(
+                mail_store, args.smtp_server, args.smtp_port, args.sender,
+                os.environ.get("SMTP_PASSWORD", ""), use_tls=not args.no_tls,
+            ).start()
+
+    def on_result(result):
+        for handler in handlers:
+            handler(result)
+
+    FolderWatcher(args.directory, workers=args.workers, max_pending=args.max_pending,
+                  interval=args.interval, on_result=on_result).run_forever()
+
+
+if __name__ == "__main__":
+    main()